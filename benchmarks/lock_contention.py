@@ -0,0 +1,199 @@
+"""
+Measure contention for the migration lock when a group of replicas run
+``yoyo apply`` at the same time against a shared SQLite database.
+
+Each replica is a separate process running the full ``yoyo apply``
+command. yoyo's internal tables are created before the replicas start,
+so that only contention for applying the migrations themselves is
+measured. The replicas start together, and each records:
+
+- the time taken to acquire the migration lock (summed if the lock is
+  taken more than once, eg to upgrade yoyo's internal tables)
+- the number of attempts made to take the lock, from the ``lock`` event
+  (see ``yoyo.events``)
+- the number of failed ``INSERT`` statements into the lock table
+- the time until ``yoyo apply`` returned
+
+The benchmark reports percentiles of each across the replicas, for each
+mode. Save the results with ``--output`` to compare with later changes to
+locking.
+
+Usage::
+
+    python benchmarks/lock_contention.py --replicas 20 --migrations 10
+"""
+from __future__ import print_function
+
+from multiprocessing import Event, Process, Queue
+from shutil import rmtree
+from tempfile import mkdtemp
+import argparse
+import json
+import os
+import platform
+import time
+
+from yoyo import get_backend
+from yoyo.backends import DatabaseBackend
+from yoyo.scripts.main import main
+
+from replica_startup import percentile
+from replica_startup import write_migrations
+
+#: Statistics reported for each replica
+STATS = ["ready", "lock_wait", "lock_attempts", "failed_inserts"]
+
+
+class LockRecorder(object):
+    """
+    A backend listener summing the lock statistics of a replica
+    """
+
+    def __init__(self):
+        self.lock_wait = 0
+        self.lock_attempts = 0
+        self.failed_inserts = 0
+
+    def __call__(self, event):
+        if event.phase != "after":
+            return
+        if event.name == "lock":
+            self.lock_wait += event.duration
+            self.lock_attempts += event.data.get("attempts", 0)
+        elif (
+            event.name == "execute"
+            and not event.succeeded
+            and event.data["sql"].startswith(
+                "INSERT INTO {} ".format(event.backend.lock_table_quoted)
+            )
+        ):
+            self.failed_inserts += 1
+
+
+def replica(argv, go, results):
+    recorder = LockRecorder()
+    # Listen to every backend the command creates
+    DatabaseBackend.listeners = [recorder]
+    go.wait()
+    started = time.time()
+    try:
+        main(argv)
+        failed = False
+    except BaseException:
+        failed = True
+    results.put(
+        {
+            "failed": failed,
+            "ready": time.time() - started,
+            "lock_wait": recorder.lock_wait,
+            "lock_attempts": recorder.lock_attempts,
+            "failed_inserts": recorder.failed_inserts,
+        }
+    )
+
+
+def run(replicas, migrations_dir, dburi, extra_args):
+    argv = ["apply", "-b", "--no-config-file", migrations_dir, "--database", dburi]
+    argv += extra_args
+    go = Event()
+    results = Queue()
+    processes = [
+        Process(target=replica, args=(argv, go, results)) for ix in range(replicas)
+    ]
+    for p in processes:
+        p.start()
+    started = time.time()
+    go.set()
+    replica_results = [results.get() for p in processes]
+    all_ready = time.time() - started
+    for p in processes:
+        p.join()
+    return replica_results, all_ready
+
+
+def summarize(replica_results, all_ready):
+    ok = [r for r in replica_results if not r["failed"]]
+    summary = {
+        "replicas": len(replica_results),
+        "failed": len(replica_results) - len(ok),
+        "all_ready": all_ready,
+    }
+    for stat in STATS:
+        values = sorted(r[stat] for r in ok)
+        summary[stat] = {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1] if values else float("nan"),
+            "total": sum(values),
+        }
+    return summary
+
+
+def main_benchmark(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--replicas", type=int, default=20)
+    parser.add_argument("--migrations", type=int, default=10)
+    parser.add_argument(
+        "--step-duration",
+        type=float,
+        default=0.05,
+        help="Seconds each migration spends in a python step",
+    )
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    modes = [("lock", []), ("wait-for-leader", ["--wait-for-leader"])]
+    results = {}
+    for name, extra_args in modes:
+        tmpdir = mkdtemp()
+        try:
+            migrations_dir = os.path.join(tmpdir, "migrations")
+            os.mkdir(migrations_dir)
+            write_migrations(migrations_dir, args.migrations, args.step_duration)
+            dburi = "sqlite:///" + os.path.join(tmpdir, "db.sqlite")
+            backend = get_backend(dburi)
+            backend.ensure_internal_schema_updated()
+            backend.connection.close()
+            results[name] = summarize(
+                *run(args.replicas, migrations_dir, dburi, extra_args)
+            )
+        finally:
+            rmtree(tmpdir)
+
+    print(
+        "{:<16} {:<15} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+            "mode", "", "p50", "p95", "p99", "max", "total"
+        )
+    )
+    for name, summary in results.items():
+        for stat in STATS:
+            print(
+                "{:<16} {:<15} {p50:>9.3f} {p95:>9.3f} {p99:>9.3f} {max:>9.3f} "
+                "{total:>9.3f}".format(name, stat, **summary[stat])
+            )
+        print(
+            "{:<16} all ready after {:.3f}s, {} failed".format(
+                name, summary["all_ready"], summary["failed"]
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "replicas": args.replicas,
+                    "migrations": args.migrations,
+                    "step_duration": args.step_duration,
+                    "results": results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+
+if __name__ == "__main__":
+    main_benchmark()
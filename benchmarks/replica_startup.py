@@ -0,0 +1,108 @@
+"""
+Measure how long it takes a group of replicas, all running ``yoyo apply``
+at the same time against a shared SQLite database, to become ready.
+
+Each replica is a separate process. The benchmark reports, for each mode,
+percentiles of the time each replica took to return from ``yoyo apply``,
+the time until all replicas were ready and the number of replicas that
+failed (eg with a lock timeout).
+
+Usage::
+
+    python benchmarks/replica_startup.py --replicas 20 --migrations 10
+"""
+from __future__ import print_function
+
+from multiprocessing import Process, Queue
+from shutil import rmtree
+from tempfile import mkdtemp
+import argparse
+import os
+import time
+
+from yoyo.scripts.main import main
+
+MIGRATION_TEMPLATE = """
+import time
+step(lambda conn: time.sleep({duration!r}))
+step("CREATE TABLE bench_{n} (id INT)")
+"""
+
+
+def write_migrations(directory, count, duration):
+    for n in range(count):
+        path = os.path.join(directory, "{:04d}.py".format(n))
+        with open(path, "w") as f:
+            f.write(MIGRATION_TEMPLATE.format(n=n, duration=duration))
+
+
+def replica(argv, started, results):
+    main(argv)
+    results.put(time.time() - started)
+
+
+def run(replicas, migrations_dir, dburi, extra_args):
+    argv = ["apply", "-b", "--no-config-file", migrations_dir, "--database", dburi]
+    argv += extra_args
+    results = Queue()
+    started = time.time()
+    processes = [
+        Process(target=replica, args=(argv, started, results))
+        for ix in range(replicas)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    ready = sorted(results.get() for p in processes if p.exitcode == 0)
+    failed = sum(1 for p in processes if p.exitcode != 0)
+    return ready, failed
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def main_benchmark(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--replicas", type=int, default=20)
+    parser.add_argument("--migrations", type=int, default=10)
+    parser.add_argument(
+        "--step-duration",
+        type=float,
+        default=0.05,
+        help="Seconds each migration spends in a python step",
+    )
+    args = parser.parse_args(argv)
+
+    modes = [("lock", []), ("wait-for-leader", ["--wait-for-leader"])]
+    print(
+        "{:<16} {:>8} {:>8} {:>8} {:>7}".format(
+            "mode", "p50", "p95", "all", "failed"
+        )
+    )
+    for name, extra_args in modes:
+        tmpdir = mkdtemp()
+        try:
+            migrations_dir = os.path.join(tmpdir, "migrations")
+            os.mkdir(migrations_dir)
+            write_migrations(migrations_dir, args.migrations, args.step_duration)
+            dburi = "sqlite:///" + os.path.join(tmpdir, "db.sqlite")
+            ready, failed = run(args.replicas, migrations_dir, dburi, extra_args)
+        finally:
+            rmtree(tmpdir)
+        print(
+            "{:<16} {:>8.3f} {:>8.3f} {:>8.3f} {:>7d}".format(
+                name,
+                percentile(ready, 50),
+                percentile(ready, 95),
+                ready[-1] if ready else float("nan"),
+                failed,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,245 @@
+"""
+Time yoyo's migration loader, dependency graph and SQLite backend against
+large synthetic migration directories.
+
+Migration directories are generated in each of these shapes:
+
+``flat``
+    Migrations with no dependencies
+``chain``
+    Each migration depends on the one before
+``fanout``
+    Every migration depends on the first
+``diamond``
+    A chain of diamonds: two migrations depend on the previous diamond's
+    join, and the next join depends on both
+
+For each shape and size the benchmark times ``read_migrations``,
+``Migration.load`` of every migration, ``topological_sort``, and
+``descendants`` of the first migration. Against a file backed and an
+in-memory SQLite database it times ``to_apply`` on a database with yoyo's
+internal tables created but no migrations applied, ``apply_migrations`` of
+the first ``--apply-count`` migrations and ``mark_migrations`` of the rest.
+Each timing is the best of ``--repeat`` runs.
+
+Results are keyed ``shape/size/database/operation``. Save them with
+``--output`` and compare a later run with ``--baseline``. The benchmark
+exits with status 1 if any operation is slower than its baseline by more
+than ``--threshold`` (a fraction) and ``--min-difference`` seconds.
+
+Usage::
+
+    python benchmarks/scale.py --sizes 1000 10000 --output baseline.json
+    python benchmarks/scale.py --sizes 1000 10000 --baseline baseline.json
+"""
+from __future__ import print_function
+
+from shutil import rmtree
+from tempfile import mkdtemp
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from yoyo import read_migrations
+from yoyo.connections import get_backend
+from yoyo.migrations import descendants
+from yoyo.migrations import topological_sort
+
+SHAPES = ["flat", "chain", "fanout", "diamond"]
+
+MIGRATION_TEMPLATE = """
+__depends__ = {depends!r}
+step("CREATE TABLE {id} (id INT)", "DROP TABLE {id}")
+"""
+
+
+def get_dependencies(shape, ids):
+    """
+    Return a dict of migration id to the ids it depends on
+    """
+    if shape == "flat":
+        return {id: [] for id in ids}
+    if shape == "chain":
+        return {id: ids[ix - 1 : ix] for ix, id in enumerate(ids)}
+    if shape == "fanout":
+        return {id: ids[:1] if ix else [] for ix, id in enumerate(ids)}
+    if shape == "diamond":
+        # ids[0] is the first join. Each diamond is two sides followed by
+        # their join
+        depends = {ids[0]: []}
+        join = ids[0]
+        for ix in range(1, len(ids), 3):
+            sides = ids[ix : ix + 2]
+            for side in sides:
+                depends[side] = [join]
+            if ix + 2 < len(ids):
+                join = ids[ix + 2]
+                depends[join] = sides
+        return depends
+    raise ValueError("Unknown shape {!r}".format(shape))
+
+
+def write_migrations(directory, shape, count):
+    # Migration ids must be unique across directories: yoyo resolves
+    # dependencies by id among every migration read by the process
+    ids = ["bench_{}_{}_{:05d}".format(shape, count, n) for n in range(count)]
+    for id, depends in get_dependencies(shape, ids).items():
+        with open(os.path.join(directory, id + ".py"), "w") as f:
+            f.write(MIGRATION_TEMPLATE.format(id=id, depends=depends))
+
+
+def timed(results, key, fn, *args):
+    started = time.time()
+    result = fn(*args)
+    elapsed = time.time() - started
+    results[key] = min(results.get(key, elapsed), elapsed)
+    return result
+
+
+def load_all(migrations):
+    for m in migrations:
+        m.load()
+
+
+def run_loader(results, prefix, directory):
+    migrations = timed(results, prefix + "read_migrations", read_migrations, directory)
+    timed(results, prefix + "Migration.load", load_all, migrations)
+    timed(results, prefix + "topological_sort", topological_sort, migrations)
+    timed(results, prefix + "descendants", descendants, migrations[0], migrations)
+    return migrations
+
+
+def run_backend(results, prefix, dburi, migrations, apply_count):
+    backend = get_backend(dburi)
+    # Create yoyo's own tables and take the lock before timing, so that
+    # to_apply measures a bootstrapped database with no migrations applied
+    backend.ensure_internal_schema_updated()
+    with backend.lock():
+        to_apply = timed(results, prefix + "to_apply", backend.to_apply, migrations)
+        timed(
+            results,
+            prefix + "apply_migrations",
+            backend.apply_migrations,
+            to_apply.__class__(to_apply[:apply_count]),
+        )
+        timed(
+            results,
+            prefix + "mark_migrations",
+            backend.mark_migrations,
+            to_apply[apply_count:],
+        )
+    backend.connection.close()
+
+
+def run(shapes, sizes, repeat, apply_count):
+    results = {}
+    for shape in shapes:
+        for size in sizes:
+            for ix in range(repeat):
+                tmpdir = mkdtemp()
+                try:
+                    migrations_dir = os.path.join(tmpdir, "migrations")
+                    os.mkdir(migrations_dir)
+                    write_migrations(migrations_dir, shape, size)
+                    prefix = "{}/{}/".format(shape, size)
+                    migrations = run_loader(results, prefix + "none/", migrations_dir)
+                    dburis = [
+                        ("file", "sqlite:///" + os.path.join(tmpdir, "db.sqlite")),
+                        ("memory", "sqlite:///:memory:"),
+                    ]
+                    for name, dburi in dburis:
+                        run_backend(
+                            results,
+                            prefix + name + "/",
+                            dburi,
+                            migrations,
+                            apply_count,
+                        )
+                finally:
+                    rmtree(tmpdir)
+    return results
+
+
+def find_regressions(results, baseline, threshold, min_difference):
+    """
+    Return the keys of results slower than the baseline by more than
+    ``threshold`` (a fraction of the baseline) and ``min_difference``
+    seconds
+    """
+    return [
+        key
+        for key, elapsed in sorted(results.items())
+        if key in baseline
+        and elapsed > baseline[key] * (1 + threshold)
+        and elapsed - baseline[key] > min_difference
+    ]
+
+
+def main_benchmark(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000], metavar="N"
+    )
+    parser.add_argument("--shapes", nargs="+", default=SHAPES, choices=SHAPES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--apply-count",
+        type=int,
+        default=100,
+        help="Number of migrations to apply; the rest are marked as applied",
+    )
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with results saved earlier")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--min-difference", type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    results = run(args.shapes, args.sizes, args.repeat, args.apply_count)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = find_regressions(
+        results, baseline, args.threshold, args.min_difference
+    )
+
+    print("{:<48} {:>10} {:>10} {:>8}".format("operation", "seconds", "baseline", ""))
+    for key, elapsed in sorted(results.items()):
+        print(
+            "{:<48} {:>10.4f} {:>10} {:>8}".format(
+                key,
+                elapsed,
+                "{:.4f}".format(baseline[key]) if key in baseline else "-",
+                "SLOWER" if key in regressions else "",
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "apply_count": args.apply_count,
+                    "results": results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+    if regressions:
+        print(
+            "{} operations slower than the baseline by more than {:.0%}".format(
+                len(regressions), args.threshold
+            ),
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -1,3 +1,5 @@
+from tempfile import NamedTemporaryFile
+
 import pytest
 
 from yoyo import backends
@@ -35,6 +37,33 @@ def dburi(request):
         drop_yoyo_tables(get_backend(request.param))
 
 
+@pytest.fixture
+def sqlite_dburi():
+    """
+    Return the URI of a temporary SQLite database file, for tests of
+    SQLite specific behaviour that need to open more than one connection
+    """
+    with NamedTemporaryFile() as tmp:
+        yield "sqlite:///" + tmp.name
+
+
+@pytest.fixture(params=get_test_dburis())
+def shared_dburi(request):
+    """
+    Like ``dburi``, but an in-memory SQLite database is replaced by a
+    temporary file so that more than one connection can be opened to it,
+    eg by the command line scripts
+    """
+    if request.param.startswith("sqlite") and ":memory:" in request.param:
+        with NamedTemporaryFile() as tmp:
+            yield "sqlite:///" + tmp.name
+        return
+    try:
+        yield request.param
+    finally:
+        drop_yoyo_tables(get_backend(request.param))
+
+
 def drop_yoyo_tables(backend):
     for table in backend.list_tables():
         if table.startswith("yoyo") or table.startswith("_yoyo"):
@@ -1,6 +1,10 @@
+from datetime import datetime, timedelta
 from functools import partial
+from multiprocessing import Process
 from tempfile import NamedTemporaryFile
 from threading import Thread
+import os
+import signal
 import time
 
 from mock import Mock
@@ -12,9 +16,11 @@ from yoyo import backends
 from yoyo import read_migrations
 from yoyo import exceptions
 from yoyo.connections import get_backend
+from yoyo.migrations import MigrationList
 
 from tests import get_test_backends
 from tests import get_test_dburis
+from tests import migrations_dir
 from tests import with_migrations
 
 
@@ -200,6 +206,427 @@ class TestConcurrency(object):
 
         thread.join()
 
+    def test_lock_polls_until_released(self, sqlite_dburi):
+        backend = get_backend(sqlite_dburi)
+        thread = Thread(target=partial(self.do_something_with_lock, sqlite_dburi))
+        t = time.time()
+        thread.start()
+        time.sleep(self.lock_duration * 0.6)
+        with patch("yoyo.backends.time.sleep", wraps=time.sleep) as sleep:
+            with backend.lock():
+                assert time.time() - t >= self.lock_duration
+        thread.join()
+        # Exponential backoff starts with short waits
+        assert sleep.call_args_list[0][0][0] <= 0.01
+
+    def test_waiters_do_not_block_concurrent_index_builds(self, dburi):
+        backend = get_backend(dburi)
+        if not isinstance(backend, backends.PostgresqlBackend):
+            pytest.skip("Test requires CREATE INDEX CONCURRENTLY")
+        with backend.transaction():
+            backend.execute("CREATE TABLE yoyo_a (id INT)")
+        with backend.lock():
+            thread = Thread(target=partial(self.do_something_with_lock, dburi))
+            thread.start()
+            time.sleep(self.lock_duration)
+            # A waiter holding a snapshot would make this wait until the
+            # server's deadlock detector cancelled one of the two sessions
+            t = time.time()
+            with backend.disable_transactions():
+                backend.execute("CREATE INDEX CONCURRENTLY yoyo_a_idx ON yoyo_a (id)")
+            assert time.time() - t < 0.5
+        thread.join()
+
+
+def hold_lock_until_killed(dburi, lease_duration):
+    backend = get_backend(dburi)
+    backend.lock_lease_duration = lease_duration
+    with backend.lock(timeout=10):
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+class TestLockNames(object):
+    def test_migration_tables_lock_independently(self, shared_dburi):
+        a = get_backend(shared_dburi, migration_table="_yoyo_migration")
+        b = get_backend(shared_dburi, migration_table="other_migration")
+        a2 = get_backend(shared_dburi, migration_table="_yoyo_migration")
+        with a.lock(), b.lock():
+            with pytest.raises(exceptions.LockTimeout):
+                with a2.lock(timeout=0.1):
+                    assert False, "Execution should never reach this point"
+
+    def test_explicit_lock_name(self, shared_dburi):
+        a = get_backend(shared_dburi, migration_table="a", lock_name="shared")
+        b = get_backend(shared_dburi, migration_table="b", lock_name="shared")
+        with a.lock():
+            with pytest.raises(exceptions.LockTimeout):
+                with b.lock(timeout=0.1):
+                    assert False, "Execution should never reach this point"
+
+    def test_break_lock_only_breaks_matching_lock(self, sqlite_dburi):
+        a = get_backend(sqlite_dburi, migration_table="a")
+        b = get_backend(sqlite_dburi, migration_table="b")
+        with a.lock(), b.lock():
+            b.break_lock()
+            locked = [
+                row[0] for row in a.execute("SELECT locked FROM yoyo_lock").fetchall()
+            ]
+            assert locked == [a._get_lock_id()]
+
+
+class TestLockOrWait(object):
+    def test_it_acquires_a_free_lock(self, shared_dburi):
+        backend = get_backend(shared_dburi)
+        other = get_backend(shared_dburi)
+        with backend.lock_or_wait(lambda: False) as locked:
+            assert locked is True
+            with pytest.raises(exceptions.LockTimeout):
+                with other.lock(timeout=0.1):
+                    assert False, "Execution should never reach this point"
+        with other.lock(timeout=0.1):
+            pass
+
+    def test_it_waits_for_the_leader(self, shared_dburi):
+        done = []
+
+        def leader(dburi):
+            with get_backend(dburi).lock():
+                time.sleep(0.2)
+                done.append(True)
+
+        backend = get_backend(shared_dburi)
+        thread = Thread(target=partial(leader, shared_dburi))
+        thread.start()
+        time.sleep(0.1)
+        with backend.lock_or_wait(lambda: bool(done)) as locked:
+            assert locked is False
+        thread.join()
+
+    def test_it_does_not_attempt_a_held_lock(self, shared_dburi):
+        backend = get_backend(shared_dburi)
+        other = get_backend(shared_dburi)
+        polls = []
+
+        def ready():
+            polls.append(True)
+            return len(polls) > 3
+
+        with other.lock():
+            with patch.object(
+                backend, "_try_acquire_lock", wraps=backend._try_acquire_lock
+            ) as try_acquire_lock:
+                with backend.lock_or_wait(ready) as locked:
+                    assert locked is False
+                assert try_acquire_lock.call_count == 0
+
+
+class TestCheck(object):
+    def test_it_reports_pending_and_unknown_migrations(self, backend):
+        a = migrations_dir(a="step('CREATE TABLE yoyo_a (id INT)')")
+        b = migrations_dir(b="step('CREATE TABLE yoyo_b (id INT)')")
+        with a as t1, b as t2:
+            assert [m.id for m in backend.check(read_migrations(t1)).pending] == ["a"]
+
+            backend.apply_migrations(read_migrations(t1, t2))
+            assert backend.check(read_migrations(t1, t2)).up_to_date
+            result = backend.check(read_migrations(t1))
+            assert result.pending == []
+            assert result.unknown == ["b"]
+
+    def test_it_does_not_load_migrations_or_lock(self, backend):
+        with migrations_dir(
+            a="raise AssertionError('Migrations should not be loaded')"
+        ) as tmpdir:
+            with patch("yoyo.backends.DatabaseBackend.lock") as lock:
+                result = backend.check(read_migrations(tmpdir))
+                assert lock.call_count == 0
+        assert [m.id for m in result.pending] == ["a"]
+
+    def test_it_does_not_create_tables(self, dburi):
+        backend = get_backend(dburi)
+        assert backend.check(MigrationList([])).up_to_date
+        assert [t for t in backend.list_tables() if "yoyo" in t] == []
+
+
+class TestGeneration(object):
+    def test_it_increments_on_every_change(self, backend):
+        with migrations_dir(a="step('CREATE TABLE yoyo_a (id INT)')") as tmpdir:
+            migrations = read_migrations(tmpdir)
+            generations = [backend.get_generation()]
+            with backend.lock():
+                backend.apply_migrations(migrations)
+                generations.append(backend.get_generation())
+                backend.rollback_migrations(migrations)
+                generations.append(backend.get_generation())
+                backend.mark_migrations(migrations)
+                generations.append(backend.get_generation())
+                backend.unmark_migrations(migrations)
+                generations.append(backend.get_generation())
+        assert generations == sorted(set(generations))
+
+    def test_it_caches_applied_hashes_by_generation(self, shared_dburi):
+        backend = get_backend(shared_dburi)
+        assert backend.get_applied_migration_hashes() == []
+        with patch.object(backend, "execute", wraps=backend.execute) as execute:
+            backend.get_applied_migration_hashes()
+            assert execute.call_count == 1
+
+        other = get_backend(shared_dburi)
+        with migrations_dir(a="step('CREATE TABLE yoyo_a (id INT)')") as tmpdir:
+            with other.lock():
+                other.apply_migrations(read_migrations(tmpdir))
+        assert len(backend.get_applied_migration_hashes()) == 1
+        backend.rollback()
+
+    def test_it_skips_the_generation_inside_transactions(self, backend):
+        backend.get_applied_migration_hashes()
+        with backend.transaction():
+            with patch.object(backend, "execute", wraps=backend.execute) as execute:
+                assert backend.get_applied_migration_hashes() == []
+                assert execute.call_count == 1
+
+
+class TestLog(object):
+    def test_it_records_durations(self, backend):
+        with migrations_dir(a="step('CREATE TABLE yoyo_a (id INT)')") as tmpdir:
+            migrations = read_migrations(tmpdir)
+            with backend.lock():
+                backend.apply_migrations(migrations)
+                backend.unmark_migrations(migrations)
+        rows = backend.execute(
+            "SELECT operation, duration_ms FROM _yoyo_log ORDER BY created_at_utc"
+        ).fetchall()
+        assert rows[0][0] == "apply"
+        assert rows[0][1] >= 0
+        assert rows[1] == ("unmark", None)
+
+    def test_it_looks_up_durations_by_migration(self, backend):
+        with migrations_dir(
+            a="step('CREATE TABLE yoyo_a (id INT)')",
+            b="step('CREATE TABLE yoyo_b (id INT)')",
+            c="step('CREATE TABLE yoyo_c (id INT)')",
+        ) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            with backend.lock():
+                backend.apply_migrations(migrations)
+            wanted = migrations.filter(lambda m: m.id != "b")
+            assert sorted(backend.get_durations(wanted, batch_size=1)) == ["a", "c"]
+            assert backend.get_durations(wanted, operation="rollback") == {}
+
+    def test_prune_keeps_entries_for_applied_migrations(self, backend):
+        with migrations_dir(
+            a="step('CREATE TABLE yoyo_a (id INT)', 'DROP TABLE yoyo_a')",
+            b="step('CREATE TABLE yoyo_b (id INT)')",
+        ) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            a, b = migrations
+            with backend.lock():
+                backend.apply_migrations(migrations)
+                backend.rollback_one(a)
+                backend.apply_one(a)
+                backend.unmark_one(b)
+
+        archived = []
+        deleted = backend.prune_log(
+            datetime.utcnow() + timedelta(days=1),
+            batch_size=2,
+            archive=archived.extend,
+        )
+        assert deleted == 4
+        assert [(r["migration_id"], r["operation"]) for r in archived] == [
+            ("a", "apply"),
+            ("b", "apply"),
+            ("a", "rollback"),
+            ("b", "unmark"),
+        ]
+        rows = backend.execute("SELECT migration_id, operation FROM _yoyo_log").fetchall()
+        assert rows == [("a", "apply")]
+
+    def test_iter_log_pages_through_filtered_entries(self, backend):
+        with migrations_dir(
+            a="step('CREATE TABLE yoyo_a (id INT)', 'DROP TABLE yoyo_a')",
+            b="step('CREATE TABLE yoyo_b (id INT)')",
+        ) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            a, b = migrations
+            with backend.lock():
+                backend.apply_migrations(migrations)
+                backend.rollback_one(a)
+                backend.apply_one(a)
+
+        def log(**kwargs):
+            return [
+                (e["migration_id"], e["operation"])
+                for e in backend.iter_log(page_size=2, **kwargs)
+            ]
+
+        assert log() == [
+            ("a", "apply"),
+            ("b", "apply"),
+            ("a", "rollback"),
+            ("a", "apply"),
+        ]
+        assert log(migration=a) == [
+            ("a", "apply"),
+            ("a", "rollback"),
+            ("a", "apply"),
+        ]
+        assert log(migration="b", operation="apply") == [("b", "apply")]
+        assert log(since=datetime.utcnow()) == []
+
+    def test_it_indexes_the_log(self, backend):
+        index_names_sql = {
+            backends.SQLiteBackend: (
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            ),
+            backends.PostgresqlBackend: "SELECT indexname FROM pg_indexes",
+            backends.MySQLBackend: (
+                "SELECT index_name FROM information_schema.statistics"
+            ),
+        }
+        if backend.__class__ not in index_names_sql:
+            pytest.skip("Test does not know how to list indexes")
+        backend.get_applied_migration_hashes()
+        sql = index_names_sql[backend.__class__]
+        indexes = {row[0] for row in backend.execute(sql).fetchall()}
+        assert {
+            "_yoyo_log_migration_hash_idx",
+            "_yoyo_log_created_at_utc_idx",
+            "_yoyo_migration_applied_at_utc_idx",
+        } <= indexes
+
+
+class TestLockLease(object):
+    """
+    Leases apply to the ``yoyo_lock`` table, which only backends without a
+    native lock use
+    """
+
+    lease_duration = 0.3
+
+    def test_it_takes_over_locks_from_killed_processes(self, sqlite_dburi):
+        for i in range(3):
+            holder = Process(
+                target=hold_lock_until_killed, args=(sqlite_dburi, self.lease_duration)
+            )
+            holder.start()
+            holder.join()
+            assert holder.exitcode == -signal.SIGKILL
+
+        backend = get_backend(sqlite_dburi)
+        t = time.time()
+        with backend.lock(timeout=5):
+            assert time.time() - t < 5
+            row = backend.execute("SELECT pid FROM yoyo_lock").fetchone()
+            assert row == (os.getpid(),)
+        assert backend.execute("SELECT COUNT(1) FROM yoyo_lock").fetchone() == (0,)
+
+    def test_it_renews_the_lease_while_held(self, sqlite_dburi):
+        backend = get_backend(sqlite_dburi)
+        backend.lock_lease_duration = self.lease_duration
+        with backend.lock():
+            time.sleep(self.lease_duration * 2)
+            waiter = get_backend(sqlite_dburi)
+            with pytest.raises(exceptions.LockTimeout):
+                with waiter.lock(timeout=self.lease_duration):
+                    assert False, "Lock should not have been taken over"
+
+    def test_it_renews_the_lease_when_transactions_outlive_it(self, sqlite_dburi):
+        """
+        The heartbeat can't renew the lease while the holder's own
+        transaction has the SQLite database locked, so the holder renews it
+        before committing.
+        """
+        expired = []
+
+        def check_lease(event):
+            if event.name == "commit" and event.phase == "after":
+                row = other.execute("SELECT expires_at FROM yoyo_lock").fetchone()
+                if row:
+                    expired.append(row[0] < datetime.utcnow())
+
+        backend = get_backend(sqlite_dburi)
+        other = get_backend(sqlite_dburi)
+        backend.lock_lease_duration = self.lease_duration
+        backend.add_listener(check_lease)
+        with migrations_dir(
+            a="""
+            import time
+            step("CREATE TABLE yoyo_a (id INT)")
+            step(lambda conn: time.sleep(0.6))
+            """
+        ) as tmpdir:
+            # Simulate the heartbeat being locked out
+            with patch("yoyo.backends._LockHeartbeat.start"), backend.lock():
+                backend.apply_migrations(read_migrations(tmpdir))
+        assert expired and not any(expired)
+
+    def test_heartbeat_does_not_wait_on_open_transactions(self, sqlite_dburi):
+        backend = get_backend(sqlite_dburi)
+        backend.lock_lease_duration = self.lease_duration
+        renew_lock_row = backend._renew_lock_row
+        in_transaction = []
+
+        def record_renewal(*args):
+            in_transaction.append(backend.in_transaction)
+            return renew_lock_row(*args)
+
+        with migrations_dir(
+            a="""
+            import time
+            step("CREATE TABLE yoyo_a (id INT)")
+            step(lambda conn: time.sleep(0.6))
+            """
+        ) as tmpdir:
+            with patch.object(backend, "_renew_lock_row", record_renewal):
+                with backend.lock():
+                    backend.apply_migrations(read_migrations(tmpdir))
+                    time.sleep(self.lease_duration)
+        assert in_transaction
+        assert not any(in_transaction)
+
+    def test_it_stops_when_the_lock_is_lost(self, sqlite_dburi):
+        backend = get_backend(sqlite_dburi)
+        backend.lock_lease_duration = self.lease_duration
+        with migrations_dir(
+            a="""
+            import sqlite3
+            import time
+
+            def take_over_lock(conn):
+                path = conn.execute("PRAGMA database_list").fetchone()[2]
+                other = sqlite3.connect(path)
+                other.execute("UPDATE yoyo_lock SET pid = 0")
+                other.commit()
+                other.close()
+                time.sleep(0.2)
+
+            step(take_over_lock)
+            step("CREATE TABLE yoyo_a (id INT)")
+            """
+        ) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            with pytest.raises(exceptions.LockLost):
+                with patch("yoyo.backends._LockHeartbeat.start"), backend.lock():
+                    backend.apply_migrations(migrations)
+        assert "yoyo_a" not in backend.list_tables()
+        assert [m.id for m in backend.to_apply(migrations)] == ["a"]
+
+    def test_it_upgrades_lock_tables_without_lease_columns(self, sqlite_dburi):
+        backend = get_backend(sqlite_dburi)
+        with backend.transaction():
+            backend.execute(
+                "CREATE TABLE yoyo_lock (locked INT DEFAULT 1, "
+                "ctime TIMESTAMP, pid INT NOT NULL, PRIMARY KEY (locked))"
+            )
+        backend = get_backend(sqlite_dburi)
+        with backend.lock():
+            row = backend.execute(
+                "SELECT pid, hostname, expires_at FROM yoyo_lock"
+            ).fetchone()
+            assert row[0] == os.getpid()
+            assert row[2] is not None
+
 
 class TestInitConnection(object):
     class MockBackend(backends.DatabaseBackend):
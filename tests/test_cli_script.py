@@ -19,7 +19,9 @@ from datetime import datetime
 from tempfile import mkdtemp
 from functools import partial
 from itertools import count
+import gzip
 import io
+import json
 import os
 import os.path
 import sys
@@ -30,12 +32,14 @@ import frozendate
 import pytest
 import tms
 
+from yoyo import internalmigrations
 from yoyo import read_migrations
 from yoyo.config import get_configparser
 from yoyo.scripts.main import main, parse_args, LEGACY_CONFIG_FILENAME
 from yoyo.scripts import newmigration
+from yoyo.scripts.migrate import CHECK_PENDING, CHECK_UNKNOWN_APPLIED
 
-from tests import with_migrations, dburi
+from tests import with_migrations, migrations_dir, dburi
 from tests import get_backend
 
 
@@ -125,7 +129,7 @@ class TestYoyoScript(TestInteractiveScript):
             main(["apply", tmpdir, "--database", dburi, "--prompt-password"])
             assert getpass.call_count == 1
             assert get_backend.call_args == call(
-                "sqlite://user:fish@/:memory", "_yoyo_migration"
+                "sqlite://user:fish@/:memory", "_yoyo_migration", lock_name=None
             )
 
     @with_migrations()
@@ -160,6 +164,181 @@ class TestYoyoScript(TestInteractiveScript):
             assert get_backend().rollback_migrations.call_count == 1
             assert get_backend().apply_migrations.call_count == 1
 
+    def test_it_does_not_lock_when_nothing_is_pending(self, shared_dburi):
+        with migrations_dir(m1='step("CREATE TABLE yoyo_test1 (id INT)")') as tmpdir:
+            main(["-b", "apply", tmpdir, "--database", shared_dburi])
+            with patch("yoyo.backends.DatabaseBackend.lock") as lock:
+                main(["-b", "apply", tmpdir, "--database", shared_dburi])
+                assert lock.call_count == 0
+
+    def test_showmigrations_streams_json_without_locking(self, shared_dburi):
+        out = io.StringIO()
+        with migrations_dir(
+            m1='step("CREATE TABLE yoyo_test1 (id INT)")',
+            m2='step("CREATE TABLE yoyo_test2 (id INT)")',
+        ) as tmpdir:
+            main(["-b", "apply", tmpdir, "--database", shared_dburi, "-r", "m1"])
+            with patch("yoyo.backends.DatabaseBackend.lock") as lock, patch(
+                "yoyo.migrations.Migration.load"
+            ) as load, patch("sys.stdout", out):
+                main(
+                    [
+                        "showmigrations",
+                        tmpdir,
+                        "--database",
+                        shared_dburi,
+                        "--format",
+                        "json",
+                    ]
+                )
+                assert lock.call_count == 0
+                assert load.call_count == 0
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [(row["migration"], row["applied"]) for row in rows] == [
+            ("m2", False),
+            ("m1", True),
+        ]
+
+    def test_showmigrations_in_dependency_order(self, shared_dburi):
+        out = io.StringIO()
+        with migrations_dir(
+            m1='step("CREATE TABLE yoyo_test1 (id INT)")',
+            m2='step("CREATE TABLE yoyo_test2 (id INT)")',
+            m0='__depends__ = ["m2"]\nstep("CREATE TABLE yoyo_test0 (id INT)")',
+        ) as tmpdir:
+            main(["-b", "apply", tmpdir, "--database", shared_dburi, "-r", "m1"])
+            with patch("sys.stdout", out):
+                main(
+                    [
+                        "showmigrations",
+                        tmpdir,
+                        "--database",
+                        shared_dburi,
+                        "--format",
+                        "json",
+                        "--dependency-order",
+                    ]
+                )
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [(row["migration"], row["applied"]) for row in rows] == [
+            ("m1", True),
+            ("m0", False),
+            ("m2", False),
+        ]
+
+    def test_apply_dry_run_estimates_from_another_database(
+        self, shared_dburi, sqlite_dburi
+    ):
+        out = io.StringIO()
+        with migrations_dir(m1='step("CREATE TABLE yoyo_test1 (id INT)")') as tmpdir:
+            main(["-b", "apply", tmpdir, "--database", shared_dburi])
+            with patch("sys.stdout", out):
+                main(
+                    [
+                        "apply",
+                        "--dry-run",
+                        tmpdir,
+                        "--database",
+                        sqlite_dburi,
+                        "--timings-from",
+                        shared_dburi,
+                    ]
+                )
+        assert get_backend(sqlite_dburi).get_applied_migration_hashes() == []
+        assert "Estimated total" in out.getvalue()
+        assert "unknown" not in out.getvalue()
+
+    def test_apply_dry_run_does_not_upgrade_the_timings_source(
+        self, shared_dburi, sqlite_dburi
+    ):
+        source = get_backend(sqlite_dburi)
+        internalmigrations.upgrade(source, internalmigrations.LOG_DURATIONS_FROM)
+        with migrations_dir(m1='step("CREATE TABLE yoyo_test1 (id INT)")') as tmpdir:
+            main(
+                [
+                    "apply",
+                    "--dry-run",
+                    tmpdir,
+                    "--database",
+                    shared_dburi,
+                    "--timings-from",
+                    sqlite_dburi,
+                ]
+            )
+        source = get_backend(sqlite_dburi)
+        assert (
+            internalmigrations.get_current_version(source)
+            == internalmigrations.LOG_DURATIONS_FROM
+        )
+        assert source.lock_table not in source.list_tables()
+
+    def test_apply_dry_run_rejects_timings_sources_without_durations(
+        self, sqlite_dburi, capsys
+    ):
+        with migrations_dir(m1='step("CREATE TABLE yoyo_test1 (id INT)")') as tmpdir:
+            with pytest.raises(SystemExit):
+                main(
+                    [
+                        "apply",
+                        "--dry-run",
+                        tmpdir,
+                        "--database",
+                        "sqlite:///:memory:",
+                        "--timings-from",
+                        sqlite_dburi,
+                    ]
+                )
+        assert "does not record migration durations" in capsys.readouterr().err
+        assert get_backend(sqlite_dburi).list_tables() == []
+
+    def test_history_streams_json(self, shared_dburi):
+        out = io.StringIO()
+        with migrations_dir(m1='step("CREATE TABLE yoyo_test1 (id INT)")') as tmpdir:
+            main(["-b", "apply", tmpdir, "--database", shared_dburi])
+            main(["-b", "unmark", tmpdir, "--database", shared_dburi])
+        with patch("sys.stdout", out):
+            main(["history", "--database", shared_dburi, "--format", "json"])
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [(row["migration_id"], row["operation"]) for row in rows] == [
+            ("m1", "apply"),
+            ("m1", "unmark"),
+        ]
+
+    def test_log_prune_exports_deleted_entries(self, shared_dburi):
+        with migrations_dir(m1='step("CREATE TABLE yoyo_test1 (id INT)")') as tmpdir:
+            export = os.path.join(tmpdir, "log.jsonl.gz")
+            main(["-b", "apply", tmpdir, "--database", shared_dburi])
+            main(["-b", "unmark", tmpdir, "--database", shared_dburi])
+            main(
+                [
+                    "log",
+                    "prune",
+                    "--older-than",
+                    "0",
+                    "--export",
+                    export,
+                    "--database",
+                    shared_dburi,
+                ]
+            )
+            with gzip.open(export, "rb") as f:
+                rows = [json.loads(line.decode("utf-8")) for line in f]
+        assert [row["operation"] for row in rows] == ["apply", "unmark"]
+        backend = get_backend(shared_dburi)
+        cursor = backend.execute("SELECT COUNT(1) FROM _yoyo_log")
+        assert cursor.fetchone()[0] == 0
+        backend.rollback()
+
+    def test_check_exit_status(self, shared_dburi):
+        m1 = migrations_dir(m1='step("CREATE TABLE yoyo_test1 (id INT)")')
+        m2 = migrations_dir(m2='step("CREATE TABLE yoyo_test2 (id INT)")')
+        with m1 as t1, m2 as t2:
+            args = ["--database", shared_dburi]
+            assert main(["check", t1] + args) == CHECK_PENDING
+            main(["-b", "apply", t1, t2] + args)
+            assert main(["check", t1, t2] + args) == 0
+            assert main(["check", t1] + args) == CHECK_UNKNOWN_APPLIED
+
     @with_migrations(m1='step("CREATE TABLE yoyo_test1 (id INT)")')
     @with_migrations(m2='step("CREATE TABLE yoyo_test2 (id INT)")')
     def test_it_applies_from_multiple_sources(self, t1, t2):
@@ -251,6 +430,7 @@ class TestYoyoScript(TestInteractiveScript):
         if dburi.startswith("sqlite"):
             pytest.skip("Test not supported for sqlite databases")
         backend = get_backend(dburi)
+        backend.create_lock_table()
         backend.execute(
             "INSERT INTO yoyo_lock (locked, ctime, pid) " "VALUES (1, :now, 1)",
             {"now": datetime.utcnow()},
@@ -0,0 +1,76 @@
+import json
+import logging
+
+from mock import patch
+import pytest
+
+from yoyo import read_migrations
+from yoyo.eventlog import EventLogger
+
+from tests import migrations_dir
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(json.loads(self.format(record)))
+
+
+def get_logger():
+    logger = logging.getLogger("yoyo.tests.events")
+    logger.handlers = [ListHandler()]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger, logger.handlers[0].lines
+
+
+def test_it_logs_migrations_steps_and_statements(backend):
+    logger, lines = get_logger()
+    backend.add_listener(EventLogger(logger, max_statement_length=20))
+    with migrations_dir(
+        a="""
+        step("CREATE TABLE yoyo_a (id INT, name VARCHAR(100))")
+        step("INSERT INTO yoyo_a VALUES (1, 'a'), (2, 'b')")
+        """,
+        b="step('SELECT foo')",
+    ) as tmpdir:
+        with backend.lock():
+            with pytest.raises(backend.DatabaseError):
+                backend.apply_migrations(read_migrations(tmpdir))
+
+    statements = [
+        line
+        for line in lines
+        if line["event"] == "statement" and line["step_id"] is not None
+    ]
+    assert [
+        (line["migration_id"], line["sql"], line["rowcount"]) for line in statements
+    ] == [
+        ("a", "CREATE TABLE yoyo_a ...", -1),
+        ("a", "INSERT INTO yoyo_a V...", 2),
+        ("b", "SELECT foo", None),
+    ]
+    assert "foo" in statements[-1]["error"]
+
+    migrations = [line for line in lines if line["event"] == "migration"]
+    assert [(line["migration_id"], line["error"] is None) for line in migrations] == [
+        ("a", True),
+        ("b", False),
+    ]
+    assert migrations[0]["migration_hash"]
+    assert len({line["run_id"] for line in lines if line["event"] != "statement"}) == 1
+
+
+def test_it_does_not_serialize_events_when_disabled(backend):
+    logger = logging.getLogger("yoyo.tests.events.disabled")
+    logger.setLevel(logging.WARNING)
+    listener = EventLogger(logger)
+    backend.add_listener(listener)
+    with migrations_dir(a="step('CREATE TABLE yoyo_a (id INT)')") as tmpdir:
+        with patch.object(listener, "get_event_data") as get_event_data:
+            with backend.lock():
+                backend.apply_migrations(read_migrations(tmpdir))
+    assert get_event_data.call_count == 0
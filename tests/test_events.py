@@ -0,0 +1,76 @@
+import pytest
+
+from yoyo import read_migrations
+
+from tests import migrations_dir
+
+
+class Recorder(object):
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def names(self, *names):
+        return [(e.phase, e.name) for e in self.events if e.name in names]
+
+
+def test_it_emits_events_around_each_operation(backend):
+    recorder = Recorder()
+    backend.add_listener(recorder)
+    with migrations_dir(
+        a="""
+        step("CREATE TABLE yoyo_a (id INT)")
+        step(lambda conn: None)
+        """
+    ) as tmpdir:
+        with backend.lock():
+            backend.apply_migrations(read_migrations(tmpdir))
+    assert recorder.names("lock", "run", "migration", "step") == [
+        ("before", "lock"),
+        ("after", "lock"),
+        ("before", "run"),
+        ("before", "migration"),
+        ("before", "step"),
+        ("after", "step"),
+        ("before", "step"),
+        ("after", "step"),
+        ("after", "migration"),
+        ("after", "run"),
+    ]
+    lock = [e for e in recorder.events if e.name == "lock"][-1]
+    assert lock.data["attempts"] == 1
+    assert lock.data["acquired"] is True
+    assert lock.duration >= 0
+
+    statements = [
+        e for e in recorder.events if e.name == "execute" and e.phase == "after"
+    ]
+    assert "CREATE TABLE yoyo_a (id INT)" in [e.data["sql"] for e in statements]
+    assert ("after", "commit") in recorder.names("commit")
+
+
+def test_after_events_carry_errors(backend):
+    recorder = Recorder()
+    backend.add_listener(recorder)
+    with migrations_dir(a="step('SELECT foo')") as tmpdir:
+        with backend.lock():
+            with pytest.raises(backend.DatabaseError):
+                backend.apply_migrations(read_migrations(tmpdir))
+    failed = [e for e in recorder.events if e.phase == "after" and e.error]
+    assert [e.name for e in failed if e.name != "execute"] == [
+        "step",
+        "migration",
+        "run",
+    ]
+    assert "SELECT foo" in [e.data["sql"] for e in failed if e.name == "execute"]
+
+
+def test_remove_listener(backend):
+    recorder = Recorder()
+    backend.add_listener(recorder)
+    backend.remove_listener(recorder)
+    assert backend.listeners is None
+    backend.execute("SELECT 1")
+    assert recorder.events == []
@@ -2,7 +2,12 @@ from datetime import datetime
 import getpass
 import socket
 
+from mock import patch
+import pytest
+
+from yoyo import backends
 from yoyo import internalmigrations
+from yoyo.querycount import count_statements
 from tests import clear_database
 
 
@@ -101,3 +106,108 @@ def test_v3_preserves_history_when_upgrading(backend):
             "this log entry created automatically by an internal schema upgrade",
         ),
     ]
+
+
+def test_it_installs_v3(backend):
+    clear_database(backend)
+    internalmigrations.upgrade(backend, version=3)
+    assert internalmigrations.get_current_version(backend) == 3
+    assert_table_is_created(backend, "_yoyo_generation")
+    cursor = backend.execute(
+        "SELECT generation FROM {0.generation_table_quoted}".format(backend)
+    )
+    assert cursor.fetchall() == [(0,)]
+
+
+def test_it_installs_v4(backend):
+    clear_database(backend)
+    internalmigrations.upgrade(backend, version=4)
+    assert internalmigrations.get_current_version(backend) == 4
+    backend.execute(
+        "SELECT duration_ms FROM {0.log_table_quoted}".format(backend)
+    ).fetchall()
+
+    # Rerunning an interrupted upgrade must succeed
+    with backend.disable_transactions():
+        internalmigrations.v4.upgrade(backend)
+
+
+def test_it_installs_v5(backend):
+    clear_database(backend)
+    internalmigrations.upgrade(backend, version=5)
+    assert internalmigrations.get_current_version(backend) == 5
+    assert_table_is_created(backend, "_yoyo_step_log")
+    backend.execute(
+        "SELECT run_id, sql_step_ms, python_step_ms "
+        "FROM {0.log_table_quoted}".format(backend)
+    ).fetchall()
+
+    # Rerunning an interrupted upgrade must succeed
+    with backend.disable_transactions():
+        backend.execute(
+            "ALTER TABLE {0.log_table_quoted} DROP COLUMN python_step_ms".format(
+                backend
+            )
+        )
+        internalmigrations.v5.upgrade(backend)
+        internalmigrations.v5.upgrade(backend)
+
+
+def test_v4_rebuilds_invalid_indexes(backend):
+    if not isinstance(backend, backends.PostgresqlBackend):
+        pytest.skip("Only PostgreSQL builds indexes concurrently")
+    clear_database(backend)
+    internalmigrations.upgrade(backend, version=4)
+    name = backend.get_index_name(backend.log_table, ["migration_hash"])
+
+    # A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind
+    with backend.disable_transactions():
+        backend.execute("DROP INDEX {}".format(backend.quote_identifier(name)))
+        backend.execute(
+            "INSERT INTO {0.log_table_quoted} (id, migration_hash) "
+            "VALUES ('a', 'x'), ('b', 'x')".format(backend)
+        )
+        with pytest.raises(backend.DatabaseError):
+            backend.execute(
+                "CREATE UNIQUE INDEX CONCURRENTLY {} "
+                "ON {} (migration_hash)".format(
+                    backend.quote_identifier(name), backend.log_table_quoted
+                )
+            )
+        sql = (
+            "SELECT indisvalid FROM pg_index "
+            "WHERE indexrelid = CAST(:name AS regclass)"
+        )
+        assert backend.execute(sql, {"name": name}).fetchall() == [(False,)]
+
+        internalmigrations.v4.upgrade(backend)
+        assert backend.execute(sql, {"name": name}).fetchall() == [(True,)]
+
+
+def test_v2_upgrade_is_batched(backend):
+    clear_database(backend)
+    internalmigrations.upgrade(backend, version=1)
+    with backend.transaction():
+        backend.executemany(
+            "INSERT INTO {0.migration_table_quoted} (id, ctime) "
+            "VALUES (:id, :when)".format(backend),
+            [
+                {"id": "migration-{}".format(n), "when": datetime(2000, 1, 1)}
+                for n in range(2500)
+            ],
+        )
+
+    with count_statements(backend) as counter, patch.object(
+        backend, "get_log_data", wraps=backend.get_log_data
+    ) as get_log_data:
+        internalmigrations.upgrade(backend, version=2)
+        assert get_log_data.call_count == 1
+    if isinstance(backend, backends.PostgresqlBackend):
+        # Rows are sent to the server in pages, not a statement at a time
+        assert counter.operations["bookkeeping", "executemany"] == 0
+        assert counter.total < 30
+
+    cursor = backend.execute(
+        "SELECT COUNT(1) FROM {0.migration_table_quoted}".format(backend)
+    )
+    assert cursor.fetchone()[0] == 2500
@@ -0,0 +1,70 @@
+import os
+
+from yoyo import read_migrations
+from yoyo.metrics import PrometheusExporter
+from yoyo.scripts.main import main
+
+from tests import migrations_dir
+
+
+def parse(text):
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_it_collects_metrics(backend):
+    exporter = PrometheusExporter()
+    backend.add_listener(exporter)
+    with migrations_dir(
+        a="""
+        step("CREATE TABLE yoyo_a (id INT)")
+        step(lambda conn: None)
+        """,
+        b="step('SELECT foo')",
+    ) as tmpdir:
+        with backend.lock():
+            try:
+                backend.apply_migrations(read_migrations(tmpdir))
+            except backend.DatabaseError:
+                pass
+    samples = parse(exporter.render())
+    assert samples['yoyo_migrations_total{operation="apply",outcome="success"}'] == 1
+    assert samples['yoyo_migrations_total{operation="apply",outcome="failure"}'] == 1
+    assert (
+        samples['yoyo_step_duration_seconds_count{operation="apply",kind="sql"}'] == 2
+    )
+    assert (
+        samples[
+            'yoyo_step_duration_seconds_bucket'
+            '{operation="apply",kind="python",le="+Inf"}'
+        ]
+        == 1
+    )
+    assert samples["yoyo_statements_total"] == 2
+    assert samples["yoyo_lock_wait_seconds_count"] >= 1
+    assert samples["yoyo_lock_attempts_total"] >= 1
+    assert samples["yoyo_bookkeeping_round_trips_total"] > 0
+
+
+def test_it_writes_a_metrics_file(shared_dburi):
+    with migrations_dir(a="step('CREATE TABLE yoyo_a (id INT)')") as tmpdir:
+        path = os.path.join(tmpdir, "yoyo.prom")
+        main(
+            [
+                "-b",
+                "apply",
+                tmpdir,
+                "--database",
+                shared_dburi,
+                "--metrics-file",
+                path,
+            ]
+        )
+        with open(path) as f:
+            samples = parse(f.read())
+        assert [p for p in os.listdir(tmpdir) if p.endswith(".tmp")] == []
+    assert samples['yoyo_migrations_total{operation="apply",outcome="success"}'] == 1
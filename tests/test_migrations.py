@@ -125,6 +125,25 @@ def test_rollbackignores_errors(tmpdir):
     assert cursor.fetchall() == []
 
 
+@with_migrations(
+    """
+    step("CREATE TABLE yoyo_test (id INT)")
+    step("INSERT INTO yoyo_test VALUES (1)")
+    step("INSERT INTO yoyo_test VALUES (2)", ignore_errors='apply')
+    """
+)
+def test_savepoints_only_used_when_errors_can_be_ignored(tmpdir):
+    backend = get_backend(dburi)
+    migrations = read_migrations(tmpdir)
+    with patch.object(backend, "savepoint", wraps=backend.savepoint) as savepoint:
+        backend.apply_migrations(migrations)
+        assert savepoint.call_count == 1
+
+    with patch.object(backend, "savepoint", wraps=backend.savepoint) as savepoint:
+        backend.rollback_migrations(migrations, force=True)
+        assert savepoint.call_count == 3
+
+
 def test_migration_is_committed(backend):
     with migrations_dir('step("CREATE TABLE yoyo_test (id INT)")') as tmpdir:
         migrations = read_migrations(tmpdir)
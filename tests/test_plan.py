@@ -0,0 +1,39 @@
+import gzip
+import json
+import os
+
+from yoyo import read_migrations
+from yoyo.migrations import topological_sort
+from yoyo.plan import analyze, get_durations_from_file
+
+from tests import with_migrations
+
+
+@with_migrations(
+    a="",
+    b="__depends__ = {'a'}",
+    c="__depends__ = {'b'}",
+    d="",
+)
+def test_it_finds_the_longest_dependency_chain(tmpdir):
+    migrations = topological_sort(read_migrations(tmpdir))
+    plan = analyze(migrations, {"a": 10, "b": 20, "c": 5, "d": 30})
+    assert plan.duration_ms == 65
+    assert [m.id for m in plan.critical_path] == ["a", "b", "c"]
+    assert plan.critical_path_ms == 35
+    assert plan.unknown == []
+
+
+@with_migrations(a="", b="")
+def test_it_reports_migrations_without_history(tmpdir):
+    path = os.path.join(tmpdir, "timings.jsonl.gz")
+    with gzip.open(path, "wb") as f:
+        for entry in [
+            {"migration_id": "a", "operation": "apply", "duration_ms": 10},
+            {"migration_id": "a", "operation": "rollback", "duration_ms": 99},
+        ]:
+            f.write((json.dumps(entry) + "\n").encode("utf-8"))
+    plan = analyze(read_migrations(tmpdir), get_durations_from_file(path))
+    assert [(m.id, d) for m, d in plan.estimates] == [("a", 10), ("b", None)]
+    assert [m.id for m in plan.unknown] == ["b"]
+    assert plan.duration_ms == 10
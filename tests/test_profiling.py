@@ -0,0 +1,51 @@
+import os
+import pstats
+
+from yoyo import read_migrations
+from yoyo.profiling import Profiler
+
+from tests import migrations_dir
+
+
+def test_it_profiles_each_python_step(backend):
+    with migrations_dir(
+        a="""
+        def busy(conn):
+            sum(range(1000))
+
+        step("CREATE TABLE yoyo_a (id INT)")
+        step(busy)
+        """,
+        b="step(lambda conn: None)",
+    ) as tmpdir:
+        profiles = os.path.join(tmpdir, "profiles")
+        with backend.lock():
+            backend.apply_migrations(read_migrations(tmpdir), profile=profiles)
+        assert backend.listeners is None
+        assert sorted(os.listdir(profiles)) == [
+            "a-apply-step1.pstats",
+            "b-apply-step0.pstats",
+            "summary.txt",
+        ]
+        stats = pstats.Stats(os.path.join(profiles, "a-apply-step1.pstats"))
+        assert "busy" in {func for _, _, func in stats.stats}
+        with open(os.path.join(profiles, "summary.txt")) as f:
+            assert "busy" in f.read()
+
+
+def test_it_profiles_each_migration(backend):
+    with migrations_dir(
+        a="""
+        step("CREATE TABLE yoyo_a (id INT)", "DROP TABLE yoyo_a")
+        step(lambda conn: None, lambda conn: None)
+        """
+    ) as tmpdir:
+        profiler = Profiler(os.path.join(tmpdir, "profiles"), by="migration")
+        migrations = read_migrations(tmpdir)
+        with backend.lock():
+            backend.apply_migrations(migrations, profile=profiler)
+            backend.rollback_migrations(migrations, profile=profiler)
+    assert [os.path.basename(p) for p in profiler.paths] == [
+        "a-apply.pstats",
+        "a-rollback.pstats",
+    ]
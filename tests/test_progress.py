@@ -0,0 +1,102 @@
+import io
+import json
+
+from mock import patch
+import pytest
+
+from yoyo import read_migrations
+from yoyo.progress import JSONSink, ProgressReporter
+
+from tests import migrations_dir
+
+
+class RecordingSink(object):
+    def __init__(self):
+        self.events = []
+
+    def update(self, event, progress):
+        self.events.append(
+            (
+                event,
+                progress.done,
+                progress.current.id if progress.current else None,
+                progress.steps_done,
+                progress.eta,
+            )
+        )
+
+
+def test_it_reports_each_migration_and_step(backend):
+    sink = RecordingSink()
+    backend.add_listener(ProgressReporter(sink, durations={"a": 60000}))
+    with migrations_dir(
+        a="""
+        step("CREATE TABLE yoyo_a (id INT)")
+        step("CREATE TABLE yoyo_b (id INT)")
+        """,
+        b="step('CREATE TABLE yoyo_c (id INT)')",
+    ) as tmpdir:
+        with backend.lock():
+            backend.apply_migrations(read_migrations(tmpdir))
+    assert [e[:4] for e in sink.events] == [
+        ("start", 0, None, 0),
+        ("migration_started", 0, "a", 0),
+        ("step_finished", 0, "a", 1),
+        ("step_finished", 0, "a", 2),
+        ("migration_finished", 1, "a", 2),
+        ("migration_started", 1, "b", 0),
+        ("step_finished", 1, "b", 1),
+        ("migration_finished", 2, "b", 1),
+        ("finish", 2, None, 1),
+    ]
+    # Before "a" runs, "b" has no recorded duration and is estimated from
+    # the mean recorded duration
+    assert sink.events[0][4] == pytest.approx(120, abs=1)
+    assert sink.events[-1][4] == 0
+
+
+def test_it_estimates_from_the_migration_log(backend):
+    sink = RecordingSink()
+    with migrations_dir(
+        a="step('CREATE TABLE yoyo_a (id INT)', 'DROP TABLE yoyo_a')"
+    ) as tmpdir:
+        migrations = read_migrations(tmpdir)
+        with backend.lock():
+            backend.apply_migrations(migrations)
+            backend.rollback_migrations(migrations)
+            backend.add_listener(ProgressReporter(sink))
+            backend.apply_migrations(migrations)
+    assert sink.events[0][0] == "start"
+    assert sink.events[0][4] is not None
+
+
+def test_it_only_reads_the_log_entries_of_the_run(backend):
+    with migrations_dir(
+        a="step('CREATE TABLE yoyo_a (id INT)', 'DROP TABLE yoyo_a')",
+        b="step('CREATE TABLE yoyo_b (id INT)', 'DROP TABLE yoyo_b')",
+    ) as tmpdir:
+        migrations = read_migrations(tmpdir)
+        with backend.lock():
+            backend.apply_migrations(migrations)
+            backend.rollback_migrations(migrations)
+            reporter = ProgressReporter(RecordingSink())
+            backend.add_listener(reporter)
+            with patch.object(backend, "iter_log") as iter_log:
+                backend.apply_migrations(migrations.filter(lambda m: m.id == "a"))
+                assert iter_log.call_count == 0
+    assert list(reporter._durations) == ["a"]
+
+
+def test_it_reports_failure(backend):
+    out = io.StringIO()
+    backend.add_listener(ProgressReporter(JSONSink(out)))
+    with migrations_dir(
+        a="step('CREATE TABLE yoyo_a (id INT)')", b="step('SELECT foo')"
+    ) as tmpdir:
+        with backend.lock():
+            with pytest.raises(backend.DatabaseError):
+                backend.apply_migrations(read_migrations(tmpdir))
+    events = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert events[-1]["event"] == "finish"
+    assert events[-1]["succeeded"] is False
+    assert events[-1]["done"] == 1
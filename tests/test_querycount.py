@@ -0,0 +1,54 @@
+import pytest
+
+from yoyo import read_migrations
+from yoyo.querycount import assert_statement_budget
+from yoyo.querycount import count_statements
+
+from tests import migrations_dir
+
+
+def apply_and_count(backend, count):
+    migrations = {
+        "m{:03d}".format(ix): "step('CREATE TABLE yoyo_t{0} (id INT)')".format(ix)
+        for ix in range(count)
+    }
+    with migrations_dir(**migrations) as tmpdir:
+        with count_statements(backend) as counter:
+            with backend.lock():
+                backend.apply_migrations(backend.to_apply(read_migrations(tmpdir)))
+    return counter
+
+
+@pytest.mark.parametrize("count", [5, 20])
+def test_applying_migrations_stays_within_budget(backend, count):
+    counter = apply_and_count(backend, count)
+    assert counter.counts["step"] == count
+    assert_statement_budget(counter, count, per_item=1, constant=6, category="lock")
+    assert_statement_budget(
+        counter, count, per_item=8, constant=40, category="bookkeeping"
+    )
+
+
+def test_budget_assertion_shows_counts(backend):
+    counter = apply_and_count(backend, 2)
+    with pytest.raises(AssertionError) as excinfo:
+        assert_statement_budget(counter, 2, per_item=1, constant=0)
+    assert "step=2" in str(excinfo.value)
+
+
+def test_it_counts_python_step_statements(backend):
+    with migrations_dir(
+        a="""
+        def insert(conn):
+            conn.cursor().execute("INSERT INTO yoyo_a VALUES (1)")
+
+        step("CREATE TABLE yoyo_a (id INT)")
+        step(insert)
+        """
+    ) as tmpdir:
+        with count_statements(backend) as counter:
+            with backend.lock():
+                backend.apply_migrations(backend.to_apply(read_migrations(tmpdir)))
+    assert not hasattr(backend.connection, "_counter")
+    assert counter.counts["step"] == 2
+    assert counter.operations["lock", "execute"] > 0
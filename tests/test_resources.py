@@ -0,0 +1,29 @@
+from yoyo import read_migrations
+from yoyo.resources import ResourceMonitor
+
+from tests import migrations_dir
+
+
+def test_it_records_resource_usage(backend):
+    monitor = ResourceMonitor(trace_allocations=True)
+    backend.add_listener(monitor)
+    with migrations_dir(
+        a="""
+        def load_everything(conn):
+            rows = [str(i) * 10 for i in range(100000)]
+
+        step("CREATE TABLE yoyo_a (id INT)")
+        step(load_everything)
+        """,
+        b="step('CREATE TABLE yoyo_b (id INT)')",
+    ) as tmpdir:
+        with backend.lock():
+            backend.apply_migrations(read_migrations(tmpdir))
+
+    a, b = monitor.usage
+    assert (a.migration_id, a.operation) == ("a", "apply")
+    assert a.tracemalloc_peak_kb > 1000
+    assert b.tracemalloc_peak_kb < a.tracemalloc_peak_kb
+    assert a.user_cpu_ms + a.system_cpu_ms >= 0
+    assert a.client_ms > 0
+    assert abs(a.db_ms + a.client_ms - a.duration_ms) <= 1
@@ -0,0 +1,45 @@
+import io
+import os
+
+from yoyo import read_migrations
+from yoyo.slowlog import SlowStatementLog
+
+from tests import migrations_dir
+
+
+def test_it_captures_plans_for_slow_dml(backend):
+    with migrations_dir(
+        a="""
+        step("CREATE TABLE yoyo_a (id INT, name VARCHAR(100))")
+        step("INSERT INTO yoyo_a VALUES (1, 'a')")
+        step("UPDATE yoyo_a SET name = 'b' WHERE id = 1")
+        """
+    ) as tmpdir:
+        report = os.path.join(tmpdir, "slow.txt")
+        slowlog = SlowStatementLog(threshold_ms=0, report=report)
+        backend.add_listener(slowlog)
+        with backend.lock():
+            backend.apply_migrations(read_migrations(tmpdir))
+        backend.remove_listener(slowlog)
+        with io.open(report, encoding="utf-8") as f:
+            text = f.read()
+    assert backend.execute("SELECT name FROM yoyo_a").fetchall() == [("b",)]
+
+    by_sql = {s.sql: s for s in slowlog.statements if s.migration_id == "a"}
+    create = by_sql["CREATE TABLE yoyo_a (id INT, name VARCHAR(100))"]
+    update = by_sql["UPDATE yoyo_a SET name = 'b' WHERE id = 1"]
+    assert create.plan is None
+    assert update.step_id == 2
+    assert "yoyo_a" in " ".join(str(v) for row in update.plan for v in row)
+
+    assert "-- plan:" in text
+    assert "UPDATE yoyo_a SET name = 'b' WHERE id = 1" in text
+
+
+def test_it_ignores_fast_statements(backend):
+    slowlog = SlowStatementLog(threshold_ms=60000)
+    backend.add_listener(slowlog)
+    with migrations_dir(a="step('CREATE TABLE yoyo_a (id INT)')") as tmpdir:
+        with backend.lock():
+            backend.apply_migrations(read_migrations(tmpdir))
+    assert slowlog.statements == []
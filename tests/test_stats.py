@@ -0,0 +1,49 @@
+from yoyo import read_migrations
+from yoyo.stats import get_stats
+
+from tests import migrations_dir
+
+
+def test_it_records_step_timings(backend):
+    with migrations_dir(
+        a="""
+        import time
+        step(lambda conn: time.sleep(0.05))
+        step("CREATE TABLE yoyo_a (id INT)")
+        """,
+        b="step('CREATE TABLE yoyo_b (id INT)')",
+    ) as tmpdir:
+        with backend.lock():
+            backend.apply_migrations(read_migrations(tmpdir))
+    rows = backend.execute(
+        "SELECT l.migration_id, s.step_id, s.kind, s.duration_ms "
+        "FROM _yoyo_step_log s JOIN _yoyo_log l ON s.log_id = l.id "
+        "ORDER BY l.migration_id, s.step_id"
+    ).fetchall()
+    assert [row[:3] for row in rows] == [
+        ("a", 0, "python"),
+        ("a", 1, "sql"),
+        ("b", 0, "sql"),
+    ]
+    assert rows[0][3] >= 50
+
+
+def test_it_summarizes_timings(backend):
+    with migrations_dir(
+        a="""
+        import time
+        step(lambda conn: time.sleep(0.05))
+        """,
+        b="step('CREATE TABLE yoyo_b (id INT)', 'DROP TABLE yoyo_b')",
+    ) as tmpdir:
+        a, b = read_migrations(tmpdir)
+        with backend.lock():
+            backend.apply_migrations(read_migrations(tmpdir))
+            backend.rollback_one(b)
+            backend.apply_one(b)
+
+    stats = get_stats(backend)
+    assert [t.migration_id for t in stats.migrations] == ["a", "b"]
+    assert [r.migrations for r in stats.runs] == [2, 1]
+    assert stats.python_step_ms >= 50
+    assert stats.duration_ms >= stats.sql_step_ms + stats.python_step_ms
@@ -36,3 +36,15 @@ class TestChangeParamStyle:
             "SELECT :a, :b, :a",
             {"a": 1, "b": 2},
         )
+
+
+class TestBackoff:
+    def test_it_increases_exponentially_to_maximum(self):
+        delays = utils.backoff(initial=1, maximum=4)
+        assert [next(delays) <= limit for limit in [1, 2, 4, 4]] == [True] * 4
+
+    def test_it_adds_jitter(self):
+        delays = utils.backoff(initial=1, maximum=1)
+        samples = [next(delays) for i in range(20)]
+        assert all(0.5 <= d <= 1 for d in samples)
+        assert len(set(samples)) > 1
@@ -12,27 +12,47 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import Mapping
-from datetime import datetime
+from collections import Mapping, namedtuple
+from datetime import datetime, timedelta
 from contextlib import contextmanager
 from importlib import import_module
 from itertools import count
 from logging import getLogger
+from threading import Event, Thread
 
 import getpass
+import hashlib
+import math
 import os
+import select
 import socket
 import time
 import uuid
 
+from . import events
 from . import exceptions
 from . import internalmigrations
+from . import profiling
 from . import utils
-from .migrations import topological_sort
+from .migrations import default_migration_table, get_migration_hash, topological_sort
 
 logger = getLogger("yoyo.migrations")
 
 
+class MigrationCheck(namedtuple("MigrationCheck", ["pending", "unknown"])):
+    """
+    The result of :meth:`DatabaseBackend.check`.
+
+    ``pending`` is the list of migrations not yet applied. ``unknown`` is
+    the list of ids of applied migrations that are not in the migration
+    set checked, eg because the database was migrated by a newer release.
+    """
+
+    @property
+    def up_to_date(self):
+        return not (self.pending or self.unknown)
+
+
 class TransactionManager(object):
     """
     Returned by the :meth:`~yoyo.backends.DatabaseBackend.transaction`
@@ -109,15 +129,86 @@ class SavepointTransactionManager(TransactionManager):
         self.backend.savepoint_rollback(self.id)
 
 
+class _LockHeartbeat(Thread):
+    """
+    Renew the lease on a ``yoyo_lock`` row until stopped.
+
+    Runs on its own connection as DB-API connections may not be shared
+    between threads. While the backend's own connection holds a transaction
+    open, the database may not allow the heartbeat to write (SQLite locks
+    the whole database), so the heartbeat skips renewing the lease and the
+    backend renews it itself: see :meth:`DatabaseBackend.renew_lock_lease`.
+
+    :ivar renewed_at: when the lease was last renewed
+    """
+
+    def __init__(self, backend, pid):
+        super(_LockHeartbeat, self).__init__(name="yoyo-lock-heartbeat")
+        self.daemon = True
+        self.backend = backend
+        self.pid = pid
+        self.hostname = socket.gethostname()
+        self.interval = backend.lock_lease_duration / 3.0
+        self.stopped = Event()
+        self.renewed_at = time.time()
+
+    def start(self):
+        # A private in-memory database can't be shared with another
+        # connection, nor another process
+        if self.backend.uri.database in (None, "", ":memory:"):
+            return
+        super(_LockHeartbeat, self).start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        connection = self.backend.connect(self.backend.uri)
+        try:
+            self.backend.init_connection(connection)
+            while not self.stopped.wait(self.interval):
+                if self.backend.in_transaction:
+                    continue
+                started = time.time()
+                try:
+                    renewed = self.backend._renew_lock_row(
+                        connection, self.pid, self.hostname
+                    )
+                except self.backend.DatabaseError:
+                    if self.backend.in_transaction:
+                        # The backend's transaction started while renewing
+                        logger.debug(
+                            "Could not renew the migration lock", exc_info=True
+                        )
+                    else:
+                        logger.exception("Could not renew the migration lock")
+                    continue
+                if renewed:
+                    self.renewed_at = started
+                else:
+                    logger.error(
+                        "Migration lock held by process %s was taken over "
+                        "by another process",
+                        self.pid,
+                    )
+                    return
+        finally:
+            connection.close()
+
+
 class DatabaseBackend(object):
 
     driver_module = None
     connection = None
 
     log_table = "_yoyo_log"
+    step_log_table = "_yoyo_step_log"
     lock_table = "yoyo_lock"
     list_tables_sql = "SELECT table_name FROM information_schema.tables"
     version_table = "_yoyo_version"
+    generation_table = "_yoyo_generation"
     migration_table = "_yoyo_migrations"
     is_applied_sql = """
         SELECT COUNT(1) FROM {0.migration_table_quoted}
@@ -136,35 +227,92 @@ class DatabaseBackend(object):
         "{0.migration_table_quoted} "
         "ORDER by applied_at_utc"
     )
+    applied_migration_ids_sql = (
+        "SELECT migration_hash, migration_id FROM {0.migration_table_quoted}"
+    )
+    generation_sql = "SELECT generation FROM {0.generation_table_quoted}"
+    increment_generation_sql = (
+        "UPDATE {0.generation_table_quoted} SET generation = generation + 1"
+    )
     create_test_table_sql = "CREATE TABLE {table_name_quoted} " "(id INT PRIMARY KEY)"
     log_migration_sql = (
         "INSERT INTO {0.log_table_quoted} "
         "(id, migration_hash, migration_id, operation, "
-        "username, hostname, created_at_utc) "
+        "username, hostname, created_at_utc, duration_ms, "
+        "run_id, sql_step_ms, python_step_ms) "
         "VALUES (:id, :migration_hash, :migration_id, "
-        ":operation, :username, :hostname, :created_at_utc)"
+        ":operation, :username, :hostname, :created_at_utc, :duration_ms, "
+        ":run_id, :sql_step_ms, :python_step_ms)"
     )
+    log_step_sql = (
+        "INSERT INTO {0.step_log_table_quoted} "
+        "(log_id, step_id, kind, duration_ms) "
+        "VALUES (:log_id, :step_id, :kind, :duration_ms)"
+    )
+    create_index_sql = "CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+    limit_sql = "LIMIT {limit:d}"
+
+    #: Prefix that turns a statement into a query for its execution plan, or
+    #: ``None`` if :meth:`explain` is not supported
+    explain_sql = "EXPLAIN "
+
+    #: Columns of the ``_yoyo_log`` table
+    log_columns = [
+        "id",
+        "migration_hash",
+        "migration_id",
+        "operation",
+        "username",
+        "hostname",
+        "comment",
+        "created_at_utc",
+        "duration_ms",
+        "run_id",
+        "sql_step_ms",
+        "python_step_ms",
+    ]
     create_lock_table_sql = (
         "CREATE TABLE {0.lock_table_quoted} ("
         "locked INT DEFAULT 1, "
         "ctime TIMESTAMP,"
         "pid INT NOT NULL,"
+        "hostname VARCHAR(255),"
+        "expires_at TIMESTAMP,"
         "PRIMARY KEY (locked))"
     )
 
+    #: Duration in seconds of the lease on a ``yoyo_lock`` row. The lease is
+    #: renewed in the background while the lock is held. Once it expires,
+    #: eg because the process holding the lock was killed, a waiting process
+    #: may take over the lock.
+    lock_lease_duration = 30
+
+    _applied_migrations_cache = None
     _driver = None
+    _has_transactional_ddl = None
     _is_locked = False
+    _lock_heartbeat = None
+    _run_id = None
+    _step_timings = None
+    _lock_attempts = 0
+
+    #: Callables registered with :meth:`add_listener`, or ``None``
+    listeners = None
+
+    #: What the statements currently being executed are for: 'step',
+    #: 'bookkeeping', 'lock' or 'introspection'. See :meth:`categorize`
+    statement_category = "bookkeeping"
     _in_transaction = False
     _internal_schema_updated = False
+    _lock_table_created = False
 
-    def __init__(self, dburi, migration_table):
+    def __init__(self, dburi, migration_table, lock_name=None):
         self.uri = dburi
         self.DatabaseError = self.driver.DatabaseError
         self._connection = self.connect(dburi)
         self.init_connection(self._connection)
         self.migration_table = migration_table
-        self.create_lock_table()
-        self.has_transactional_ddl = self._check_transactional_ddl()
+        self.lock_name = lock_name or migration_table
 
     def _load_driver_module(self):
         """
@@ -185,12 +333,32 @@ class DatabaseBackend(object):
     def connection(self):
         return self._connection
 
+    @property
+    def in_transaction(self):
+        """
+        True if a transaction is currently open on the connection
+        """
+        return self._in_transaction
+
     def init_connection(self, connection):
         """
         Called when creating a connection or after a rollback. May do any
         db specific tasks required to make the connection ready for use.
         """
 
+    def _get_lock_id(self):
+        """
+        Return an integer identifying the migration lock.
+
+        Migration sets stored in different tables use different locks, so
+        they may be applied concurrently. The default migration table uses
+        the lock id of earlier versions of yoyo.
+        """
+        if self.lock_name == default_migration_table:
+            return 1
+        digest = hashlib.sha256(self.lock_name.encode("utf-8")).hexdigest()
+        return int(digest[:8], 16) % (2 ** 31 - 2) + 2
+
     def __getattr__(self, attrname):
         if attrname.endswith("_quoted"):
             unquoted = getattr(self, attrname.rsplit("_quoted")[0])
@@ -200,6 +368,18 @@ class DatabaseBackend(object):
     def quote_identifier(self, s):
         return '"{}"'.format(s)
 
+    @property
+    def has_transactional_ddl(self):
+        """
+        True if the database supports transactional DDL. This is checked on
+        first use, so that commands which never run a migration don't pay
+        for the test.
+        """
+        if self._has_transactional_ddl is None:
+            with self.categorize("introspection"):
+                self._has_transactional_ddl = self._check_transactional_ddl()
+        return self._has_transactional_ddl
+
     def _check_transactional_ddl(self):
         """
         Return True if the database supports committing/rolling back
@@ -224,10 +404,11 @@ class DatabaseBackend(object):
         This is used by the test suite to clean up tables
         generated during testing
         """
-        cursor = self.execute(
-            self.list_tables_sql, dict({"database": self.uri.database}, **kwargs)
-        )
-        return [row[0] for row in cursor.fetchall()]
+        with self.categorize("introspection"):
+            cursor = self.execute(
+                self.list_tables_sql, dict({"database": self.uri.database}, **kwargs)
+            )
+            return [row[0] for row in cursor.fetchall()]
 
     def transaction(self):
         if not self._in_transaction:
@@ -239,12 +420,45 @@ class DatabaseBackend(object):
     def cursor(self):
         return self.connection.cursor()
 
+    @contextmanager
+    def categorize(self, category):
+        """
+        Set :attr:`statement_category` for statements executed within the
+        block, eg so that :mod:`yoyo.querycount` can count them separately
+        """
+        saved = self.statement_category
+        self.statement_category = category
+        try:
+            yield
+        finally:
+            self.statement_category = saved
+
+    def add_listener(self, listener):
+        """
+        Register ``listener`` to be called with an :class:`~yoyo.events.Event`
+        before and after each operation listed in :mod:`yoyo.events`.
+        """
+        self.listeners = (self.listeners or []) + [listener]
+
+    def remove_listener(self, listener):
+        listeners = list(self.listeners or [])
+        listeners.remove(listener)
+        self.listeners = listeners or None
+
     def commit(self):
-        self.connection.commit()
+        if self.listeners is None:
+            self.connection.commit()
+        else:
+            with events.emit(self, "commit"):
+                self.connection.commit()
         self._in_transaction = False
 
     def rollback(self):
-        self.connection.rollback()
+        if self.listeners is None:
+            self.connection.rollback()
+        else:
+            with events.emit(self, "rollback"):
+                self.connection.rollback()
         self.init_connection(self.connection)
         self._in_transaction = False
 
@@ -294,55 +508,369 @@ class DatabaseBackend(object):
             return
 
         pid = os.getpid()
-        self._insert_lock_row(pid, timeout)
+
+        def acquire():
+            self._acquire_lock(pid, timeout)
+            return True
+
+        with self.categorize("lock"):
+            if self.listeners is None:
+                acquire()
+            else:
+                self._acquire_lock_with_events(acquire)
         try:
             self._is_locked = True
             yield
+        finally:
             self._is_locked = False
+            with self.categorize("lock"):
+                self._release_lock(pid)
+
+    @contextmanager
+    def lock_or_wait(self, ready, timeout=10):
+        """
+        Acquire the migration lock, unless ``ready`` returns True while
+        waiting for another process to release it.
+
+        This lets processes starting together wait for a single "leader" to
+        apply migrations, instead of each queueing for the lock in turn.
+
+        :param ready: callable returning True once the work the lock would
+                      protect has been done by another process (eg all
+                      migrations applied)
+        :param timeout: duration in seconds before raising a LockTimeout error.
+        :return: context manager yielding True if the lock was acquired, or
+                 False if ``ready`` returned True first, in which case the lock
+                 is not held.
+        """
+        if self._is_locked:
+            yield True
+            return
+
+        pid = os.getpid()
+
+        def acquire():
+            return self._acquire_lock_unless_ready(pid, ready, timeout)
+
+        with self.categorize("lock"):
+            if self.listeners is None:
+                acquired = acquire()
+            else:
+                acquired = self._acquire_lock_with_events(acquire)
+        if not acquired:
+            yield False
+            return
+
+        try:
+            self._is_locked = True
+            yield True
         finally:
-            self._delete_lock_row(pid)
+            self._is_locked = False
+            with self.categorize("lock"):
+                self._release_lock(pid)
 
-    def _insert_lock_row(self, pid, timeout, poll_interval=0.5):
-        poll_interval = min(poll_interval, timeout)
+    def _acquire_lock_unless_ready(self, pid, ready, timeout):
+        """
+        Try to acquire the migration lock until either it is acquired,
+        returning True, or ``ready()`` returns True, returning False.
+
+        While another process holds the lock only ``ready()`` is polled: the
+        lock is not attempted until it is seen to be free.
+        """
         started = time.time()
-        while True:
-            try:
-                with self.transaction():
-                    self.execute(
-                        "INSERT INTO {} (locked, ctime, pid) "
-                        "VALUES (1, :when, :pid)".format(self.lock_table_quoted),
-                        {"when": datetime.utcnow(), "pid": pid},
-                    )
-            except self.DatabaseError:
+        delays = utils.backoff()
+        try:
+            while True:
+                if ready():
+                    return False
+                if self._lock_is_free() and self._try_acquire_lock(pid):
+                    return True
                 if timeout and time.time() > started + timeout:
-                    cursor = self.execute(
-                        "SELECT pid FROM {}".format(self.lock_table_quoted)
+                    raise exceptions.LockTimeout(
+                        "Timed out waiting for another process to release the "
+                        "migration lock"
                     )
-                    row = cursor.fetchone()
-                    if row:
-                        raise exceptions.LockTimeout(
-                            "Process {} has locked this database "
-                            "(run yoyo break-lock to remove this lock)".format(row[0])
-                        )
-                    else:
-                        raise exceptions.LockTimeout(
-                            "Database locked "
-                            "(run yoyo break-lock to remove this lock)"
+                delay = next(delays)
+                if timeout:
+                    delay = max(0, min(delay, started + timeout - time.time()))
+                self._wait_for_lock_release(delay)
+        finally:
+            self._stop_waiting_for_lock_release()
+
+    def _acquire_lock_with_events(self, acquire):
+        """
+        Call ``acquire``, emitting 'lock' events around it
+        """
+        self._lock_attempts = 0
+        with events.emit(self, "lock", lock_name=self.lock_name) as data:
+            try:
+                data["acquired"] = acquired = acquire()
+            finally:
+                data["attempts"] = self._lock_attempts
+        return acquired
+
+    def _acquire_lock(self, pid, timeout):
+        """
+        Acquire the migration lock, waiting up to ``timeout`` seconds.
+
+        Backends with a native locking primitive override this. The default
+        implementation polls the ``yoyo_lock`` table.
+        """
+        self.create_lock_table()
+        self._insert_lock_row(pid, timeout)
+        self._start_lock_heartbeat(pid)
+
+    def _try_acquire_lock(self, pid):
+        """
+        Make a single attempt to acquire the migration lock without waiting.
+        Return True if the lock was acquired.
+        """
+        self.create_lock_table()
+        if not self._try_insert_lock_row(pid, socket.gethostname()):
+            return False
+        self._start_lock_heartbeat(pid)
+        return True
+
+    def _lock_is_free(self):
+        """
+        Return True unless another process holds the migration lock, without
+        trying to take it.
+
+        The default implementation reads the ``yoyo_lock`` row: the lock is
+        free if there is no row, or if its lease has expired.
+        """
+        self.create_lock_table()
+        with self.transaction():
+            row = self.execute(
+                "SELECT pid FROM {} WHERE locked = :lock_id "
+                "AND (expires_at IS NULL OR expires_at >= :now)".format(
+                    self.lock_table_quoted
+                ),
+                {"lock_id": self._get_lock_id(), "now": datetime.utcnow()},
+            ).fetchone()
+        return row is None
+
+    def _release_lock(self, pid):
+        """
+        Release the migration lock acquired by :meth:`_acquire_lock`
+        """
+        self._lock_heartbeat.stop()
+        self._lock_heartbeat = None
+        self._delete_lock_row(pid)
+
+    def _wait_for_lock_release(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for the migration lock to be released
+        by another process. This may return early: the default implementation
+        simply sleeps.
+        """
+        time.sleep(timeout)
+
+    def _stop_waiting_for_lock_release(self):
+        """
+        Clean up any resources used by :meth:`_wait_for_lock_release`
+        """
+
+    def _start_lock_heartbeat(self, pid):
+        self._lock_heartbeat = _LockHeartbeat(self, pid)
+        self._lock_heartbeat.start()
+
+    def _get_lock_expiry(self):
+        return datetime.utcnow() + timedelta(seconds=self.lock_lease_duration)
+
+    def _insert_lock_row(self, pid, timeout, poll_interval=0.5):
+        started = time.time()
+        delays = utils.backoff(maximum=poll_interval)
+        hostname = socket.gethostname()
+        while not self._try_insert_lock_row(pid, hostname):
+            if timeout and time.time() > started + timeout:
+                cursor = self.execute(
+                    "SELECT pid, hostname, expires_at FROM {} "
+                    "WHERE locked = :lock_id".format(self.lock_table_quoted),
+                    {"lock_id": self._get_lock_id()},
+                )
+                row = cursor.fetchone()
+                if row:
+                    raise exceptions.LockTimeout(
+                        "Process {} on {} has locked this database "
+                        "until {} "
+                        "(run yoyo break-lock to remove this lock)".format(
+                            row[0], row[1] or "(unknown host)", row[2] or "(never)"
                         )
-                time.sleep(poll_interval)
-            else:
-                return
+                    )
+                else:
+                    raise exceptions.LockTimeout(
+                        "Database locked " "(run yoyo break-lock to remove this lock)"
+                    )
+            delay = next(delays)
+            if timeout:
+                delay = max(0, min(delay, started + timeout - time.time()))
+            time.sleep(delay)
+
+    def _try_insert_lock_row(self, pid, hostname):
+        """
+        Insert the lock row, or take over an expired lock.
+        Return True if the lock was acquired.
+        """
+        self._lock_attempts += 1
+        try:
+            with self.transaction():
+                self.execute(
+                    "INSERT INTO {} (locked, ctime, pid, hostname, expires_at) "
+                    "VALUES (:lock_id, :when, :pid, :hostname, :expires_at)".format(
+                        self.lock_table_quoted
+                    ),
+                    {
+                        "lock_id": self._get_lock_id(),
+                        "when": datetime.utcnow(),
+                        "pid": pid,
+                        "hostname": hostname,
+                        "expires_at": self._get_lock_expiry(),
+                    },
+                )
+        except self.DatabaseError:
+            return self._take_over_expired_lock(pid, hostname)
+        return True
+
+    def _take_over_expired_lock(self, pid, hostname):
+        """
+        Take over the lock if its holder has stopped renewing its lease, for
+        example because the process was killed. Return True if the lock was
+        taken over.
+        """
+        try:
+            with self.transaction():
+                row = self.execute(
+                    "SELECT pid, hostname FROM {} "
+                    "WHERE locked = :lock_id AND expires_at < :now".format(
+                        self.lock_table_quoted
+                    ),
+                    {"lock_id": self._get_lock_id(), "now": datetime.utcnow()},
+                ).fetchone()
+                if row is None:
+                    return False
+                cursor = self.execute(
+                    "UPDATE {} "
+                    "SET ctime = :when, pid = :pid, hostname = :hostname, "
+                    "expires_at = :expires_at "
+                    "WHERE locked = :lock_id AND pid = :old_pid "
+                    "AND expires_at < :when".format(self.lock_table_quoted),
+                    {
+                        "lock_id": self._get_lock_id(),
+                        "when": datetime.utcnow(),
+                        "pid": pid,
+                        "hostname": hostname,
+                        "expires_at": self._get_lock_expiry(),
+                        "old_pid": row[0],
+                    },
+                )
+                if cursor.rowcount != 1:
+                    return False
+        except self.DatabaseError:
+            return False
+        logger.warning(
+            "Took over expired migration lock held by process %s on %s",
+            row[0],
+            row[1],
+        )
+        return True
+
+    def renew_lock_lease(self, force=False):
+        """
+        Extend the lease on the ``yoyo_lock`` row held by this process, on
+        the backend's own connection.
+
+        This is called after each migration step, and with ``force`` in
+        each transaction that records migrations as applied or rolled back.
+        The lease is then fresh when the transaction commits even if the
+        heartbeat could not renew it while the transaction was open, and
+        nothing is recorded once the lock has been lost. Unless ``force`` is
+        True, the lease is only renewed once a third of it has elapsed:
+        until it expires, no other process can take over the lock.
+
+        Does nothing unless the lock is held through the ``yoyo_lock``
+        table.
+
+        :raises LockLost: if another process has taken over the lock
+        """
+        heartbeat = self._lock_heartbeat
+        if heartbeat is None:
+            return
+        started = time.time()
+        if not force and started < heartbeat.renewed_at + heartbeat.interval:
+            return
+        with self.categorize("lock"):
+            cursor = self.execute(
+                *self._get_renew_lock_sql(heartbeat.pid, heartbeat.hostname)
+            )
+        if cursor.rowcount != 1:
+            raise exceptions.LockLost(
+                "The migration lock held by process {} was taken over by "
+                "another process".format(heartbeat.pid)
+            )
+        heartbeat.renewed_at = started
+
+    def _get_renew_lock_sql(self, pid, hostname):
+        return (
+            "UPDATE {} SET expires_at = :expires_at "
+            "WHERE locked = :lock_id AND pid = :pid AND hostname = :hostname".format(
+                self.lock_table_quoted
+            ),
+            {
+                "lock_id": self._get_lock_id(),
+                "expires_at": self._get_lock_expiry(),
+                "pid": pid,
+                "hostname": hostname,
+            },
+        )
+
+    def _renew_lock_row(self, connection, pid, hostname):
+        """
+        Extend the lease on the lock row, using ``connection`` so that the
+        lease may be renewed while the backend's own connection is busy.
+        Return False if the lock is no longer held by this process.
+        """
+        sql, params = utils.change_param_style(
+            self.driver.paramstyle, *self._get_renew_lock_sql(pid, hostname)
+        )
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            renewed = cursor.rowcount == 1
+        finally:
+            cursor.close()
+        connection.commit()
+        return renewed
 
     def _delete_lock_row(self, pid):
         with self.transaction():
             self.execute(
-                "DELETE FROM {} WHERE pid=:pid".format(self.lock_table_quoted),
-                {"pid": pid},
+                "DELETE FROM {} "
+                "WHERE locked = :lock_id AND pid = :pid AND hostname = :hostname".format(
+                    self.lock_table_quoted
+                ),
+                {
+                    "lock_id": self._get_lock_id(),
+                    "pid": pid,
+                    "hostname": socket.gethostname(),
+                },
             )
 
     def break_lock(self):
+        """
+        Remove the ``yoyo_lock`` row for this backend's lock name.
+
+        Native locks (PostgreSQL, MySQL) are released automatically when the
+        session holding them ends, so only lock table rows need breaking.
+        """
+        self.create_lock_table()
         with self.transaction():
-            self.execute("DELETE FROM {}".format(self.lock_table_quoted))
+            self.execute(
+                "DELETE FROM {} WHERE locked = :lock_id".format(
+                    self.lock_table_quoted
+                ),
+                {"lock_id": self._get_lock_id()},
+            )
 
     def execute(self, sql, params=None):
         """
@@ -358,18 +886,132 @@ class DatabaseBackend(object):
 
         cursor = self.cursor()
         sql, params = utils.change_param_style(self.driver.paramstyle, sql, params)
-        cursor.execute(sql, params)
+        if self.listeners is None:
+            cursor.execute(sql, params)
+        else:
+            with events.emit(self, "execute", sql=sql, params=params) as data:
+                cursor.execute(sql, params)
+                data["rowcount"] = cursor.rowcount
+        return cursor
+
+    def executemany(self, sql, params_seq):
+        """
+        Execute a single statement once for each dictionary of parameters in
+        ``params_seq``, returning the cursor.
+        """
+        cursor = self.cursor()
+        converted = [
+            utils.change_param_style(self.driver.paramstyle, sql, params)
+            for params in params_seq
+        ]
+        if not converted:
+            return cursor
+        sql = converted[0][0]
+        params_seq = [params for _, params in converted]
+        if self.listeners is None:
+            self._executemany(cursor, sql, params_seq)
+        else:
+            with events.emit(
+                self, "execute", sql=sql, params=params_seq, many=True
+            ) as data:
+                self._executemany(cursor, sql, params_seq)
+                data["rowcount"] = cursor.rowcount
         return cursor
 
+    def _executemany(self, cursor, sql, params_seq):
+        cursor.executemany(sql, params_seq)
+
+    def explain(self, sql, params=None):
+        """
+        Return the execution plan for ``sql`` as a list of rows, or ``None``
+        if the backend cannot explain statements.
+
+        ``sql`` and ``params`` must already be in the driver's parameter
+        style, as they are in 'execute' events. The plan is queried on a
+        separate cursor without emitting events. Inside a transaction it is
+        queried within a savepoint, so that an error leaves the transaction
+        usable.
+        """
+        if self.explain_sql is None:
+            return None
+        cursor = self.connection.cursor()
+        savepoint = self._in_transaction
+        try:
+            if savepoint:
+                cursor.execute("SAVEPOINT yoyo_explain")
+            try:
+                if params is None:
+                    cursor.execute(self.explain_sql + sql)
+                else:
+                    cursor.execute(self.explain_sql + sql, params)
+                plan = [tuple(row) for row in cursor.fetchall()]
+            except self.DatabaseError:
+                if savepoint:
+                    cursor.execute("ROLLBACK TO SAVEPOINT yoyo_explain")
+                raise
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT yoyo_explain")
+            return plan
+        finally:
+            cursor.close()
+
+    def create_index(self, table, columns):
+        """
+        Create an index on ``table`` unless it already exists.
+        """
+        self.execute(
+            self.create_index_sql.format(
+                name=self.quote_identifier(self.get_index_name(table, columns)),
+                table=self.quote_identifier(table),
+                columns=", ".join(self.quote_identifier(c) for c in columns),
+            )
+        )
+
+    def get_index_name(self, table, columns):
+        return "{}_{}_idx".format(table, "_".join(columns))
+
     def create_lock_table(self):
         """
         Create the lock table if it does not already exist.
+
+        This is called when the lock table is first needed, so that backends
+        using a native lock, and commands that never lock, don't touch it.
         """
-        try:
-            with self.transaction():
-                self.execute(self.create_lock_table_sql.format(self))
-        except self.DatabaseError:
-            pass
+        if self._lock_table_created:
+            return
+        with self.categorize("introspection"):
+            try:
+                with self.transaction():
+                    self.execute(self.create_lock_table_sql.format(self))
+            except self.DatabaseError:
+                self._upgrade_lock_table()
+        self._lock_table_created = True
+
+    def _upgrade_lock_table(self):
+        """
+        Add the lease columns to lock tables created by earlier versions
+        """
+        for column, type in [("hostname", "VARCHAR(255)"), ("expires_at", "TIMESTAMP")]:
+            try:
+                with self.transaction():
+                    self.execute(
+                        "SELECT {} FROM {} WHERE 1 = 0".format(
+                            column, self.lock_table_quoted
+                        )
+                    )
+                continue
+            except self.DatabaseError:
+                pass
+            try:
+                with self.transaction():
+                    self.execute(
+                        "ALTER TABLE {} ADD COLUMN {} {}".format(
+                            self.lock_table_quoted, column, type
+                        )
+                    )
+            except self.DatabaseError:
+                # Another process may have upgraded the table concurrently
+                pass
 
     def ensure_internal_schema_updated(self):
         """
@@ -377,24 +1019,93 @@ class DatabaseBackend(object):
         """
         if self._internal_schema_updated:
             return
-        if internalmigrations.needs_upgrading(self):
+        with self.categorize("introspection"):
+            needs_upgrading = internalmigrations.needs_upgrading(self)
+        if needs_upgrading:
             assert not self._in_transaction
             with self.lock():
                 internalmigrations.upgrade(self)
                 self.connection.commit()
-                self._internal_schema_updated = True
+        self._internal_schema_updated = True
 
     def is_applied(self, migration):
         return migration.hash in self.get_applied_migration_hashes()
 
+    def get_generation(self):
+        """
+        Return the generation counter of the migration tables.
+
+        The generation is incremented every time a migration is applied,
+        rolled back, marked or unmarked. If it has not changed, nor have the
+        applied migrations.
+        """
+        self.ensure_internal_schema_updated()
+        sql = self.generation_sql.format(self)
+        return self.execute(sql).fetchone()[0]
+
     def get_applied_migration_hashes(self):
         """
         Return the list of migration hashes in the order in which they
-        were applied
+        were applied.
+
+        Outside a transaction, the list is cached until the generation
+        counter changes. Inside a transaction the cache is bypassed, as
+        uncommitted changes may yet be rolled back.
         """
-        self.ensure_internal_schema_updated()
+        use_cache = not self._in_transaction
+        if use_cache:
+            generation = self.get_generation()
+            if self._applied_migrations_cache:
+                cached_generation, hashes = self._applied_migrations_cache
+                if cached_generation == generation:
+                    return list(hashes)
+        else:
+            self.ensure_internal_schema_updated()
         sql = self.applied_migrations_sql.format(self)
-        return [row[0] for row in self.execute(sql).fetchall()]
+        hashes = [row[0] for row in self.execute(sql).fetchall()]
+        if use_cache:
+            self._applied_migrations_cache = (generation, hashes)
+        return list(hashes)
+
+    def has_unapplied(self, migrations):
+        """
+        Return True if any of ``migrations`` has not been applied.
+
+        Only migration hashes are compared: no migration scripts are loaded
+        and the migration lock is not required.
+        """
+        applied = set(self.get_applied_migration_hashes())
+        return any(m.hash not in applied for m in migrations)
+
+    def check(self, migrations):
+        """
+        Compare ``migrations`` with the migrations applied to the database,
+        returning a :class:`MigrationCheck`.
+
+        This is a single query: migration scripts are not loaded, the
+        migration lock is not taken and yoyo's internal schema is never
+        upgraded, making it suitable for readiness probes.
+        """
+        try:
+            with self.transaction():
+                sql = self.applied_migration_ids_sql.format(self)
+                applied = dict(self.execute(sql).fetchall())
+        except self.DatabaseError:
+            # A database that yoyo has never touched has nothing applied.
+            # Internal schemas from older versions need ``yoyo apply`` to
+            # upgrade them before they can be checked.
+            if internalmigrations.get_current_version(self) != 0:
+                raise
+            applied = {}
+        hashes = {m.hash for m in migrations}
+        return MigrationCheck(
+            pending=[m for m in migrations if m.hash not in applied],
+            unknown=sorted(
+                migration_id
+                for migration_hash, migration_id in applied.items()
+                if migration_hash not in hashes
+            ),
+        )
 
     def to_apply(self, migrations):
         """
@@ -433,10 +1144,69 @@ class DatabaseBackend(object):
             reversed(topological_sort(ms)), migrations.post_apply
         )
 
-    def apply_migrations(self, migrations, force=False):
+    @property
+    def run_id(self):
+        """
+        The id of the run in progress (see :meth:`log_run`), or ``None``
+        """
+        return self._run_id
+
+    @contextmanager
+    def log_run(self):
+        """
+        Group the log entries written within the context into a single run,
+        identified by their ``run_id``. Nested runs join the outer run.
+        """
+        if self._run_id:
+            yield
+            return
+        self._run_id = str(uuid.uuid1())
+        try:
+            yield
+        finally:
+            self._run_id = None
+
+    @contextmanager
+    def _profiling(self, profile):
+        """
+        Register a :class:`~yoyo.profiling.Profiler` for ``profile`` (see
+        :meth:`apply_migrations`) for the duration of the block
+        """
+        if profile is None:
+            yield
+            return
+        if not isinstance(profile, profiling.Profiler):
+            profile = profiling.Profiler(profile)
+        self.add_listener(profile)
+        try:
+            yield
+        finally:
+            self.remove_listener(profile)
+            profile.write_summary()
+
+    @contextmanager
+    def _run_events(self, migrations, operation):
+        """
+        Emit 'run' events around applying or rolling back ``migrations``
+        """
+        if self.listeners is None:
+            yield
+        else:
+            with events.emit(self, "run", migrations=migrations, operation=operation):
+                yield
+
+    def apply_migrations(self, migrations, force=False, profile=None):
+        """
+        Apply the list of migrations, then any post-apply hooks.
+
+        :param profile: a directory to write a :mod:`cProfile` profile of
+                        each python step to, or a
+                        :class:`~yoyo.profiling.Profiler`
+        """
         if migrations:
-            self.apply_migrations_only(migrations, force=force)
-            self.run_post_apply(migrations, force=force)
+            with self.log_run(), self._profiling(profile):
+                self.apply_migrations_only(migrations, force=force)
+                self.run_post_apply(migrations, force=force)
 
     def apply_migrations_only(self, migrations, force=False):
         """
@@ -445,46 +1215,59 @@ class DatabaseBackend(object):
         """
         if not migrations:
             return
-        for m in migrations:
-            try:
-                self.apply_one(m, force=force)
-            except exceptions.BadMigration:
-                continue
+        self.ensure_internal_schema_updated()
+        with self.log_run(), self._run_events(migrations, "apply"):
+            for m in migrations:
+                try:
+                    self.apply_one(m, force=force)
+                except exceptions.BadMigration:
+                    continue
 
     def run_post_apply(self, migrations, force=False):
         """
         Run any post-apply migrations present in ``migrations``
         """
-        for m in migrations.post_apply:
-            self.apply_one(m, mark=False, force=force)
+        with self.log_run():
+            for m in migrations.post_apply:
+                self.apply_one(m, mark=False, force=force)
 
-    def rollback_migrations(self, migrations, force=False):
+    def rollback_migrations(self, migrations, force=False, profile=None):
+        """
+        Roll back the list of migrations.
+
+        :param profile: as for :meth:`apply_migrations`
+        """
         self.ensure_internal_schema_updated()
         if not migrations:
             return
-        for m in migrations:
-            try:
-                self.rollback_one(m, force)
-            except exceptions.BadMigration:
-                continue
+        with self.log_run(), self._profiling(profile), self._run_events(
+            migrations, "rollback"
+        ):
+            for m in migrations:
+                try:
+                    self.rollback_one(m, force)
+                except exceptions.BadMigration:
+                    continue
 
     def mark_migrations(self, migrations):
         self.ensure_internal_schema_updated()
-        with self.transaction():
+        with self.log_run(), self.transaction():
             for m in migrations:
                 try:
                     self.mark_one(m)
                 except exceptions.BadMigration:
                     continue
+            self.renew_lock_lease(force=True)
 
     def unmark_migrations(self, migrations):
         self.ensure_internal_schema_updated()
-        with self.transaction():
+        with self.log_run(), self.transaction():
             for m in migrations:
                 try:
                     self.unmark_one(m)
                 except exceptions.BadMigration:
                     continue
+            self.renew_lock_lease(force=True)
 
     def apply_one(self, migration, force=False, mark=True):
         """
@@ -492,10 +1275,18 @@ class DatabaseBackend(object):
         """
         logger.info("Applying %s", migration.id)
         self.ensure_internal_schema_updated()
-        migration.process_steps(self, "apply", force=force)
-        self.log_migration(migration, "apply")
-        if mark:
-            with self.transaction():
+        if self.listeners is None:
+            self._apply_one(migration, force, mark)
+        else:
+            with events.emit(self, "migration", migration=migration, operation="apply"):
+                self._apply_one(migration, force, mark)
+
+    def _apply_one(self, migration, force, mark):
+        duration, steps = self._process_steps(migration, "apply", force)
+        with self.transaction():
+            self.renew_lock_lease(force=True)
+            self.log_migration(migration, "apply", duration=duration, steps=steps)
+            if mark:
                 self.mark_one(migration, log=False)
 
     def rollback_one(self, migration, force=False):
@@ -504,15 +1295,51 @@ class DatabaseBackend(object):
         """
         logger.info("Rolling back %s", migration.id)
         self.ensure_internal_schema_updated()
-        migration.process_steps(self, "rollback", force=force)
-        self.log_migration(migration, "rollback")
+        if self.listeners is None:
+            self._rollback_one(migration, force)
+        else:
+            with events.emit(
+                self, "migration", migration=migration, operation="rollback"
+            ):
+                self._rollback_one(migration, force)
+
+    def _rollback_one(self, migration, force):
+        duration, steps = self._process_steps(migration, "rollback", force)
         with self.transaction():
+            self.renew_lock_lease(force=True)
+            self.log_migration(migration, "rollback", duration=duration, steps=steps)
             self.unmark_one(migration, log=False)
 
+    def _process_steps(self, migration, direction, force):
+        """
+        Apply or rollback the steps of ``migration``.
+
+        :return: a tuple of the time taken in seconds and a list of
+                 ``(step_id, kind, duration)`` tuples, one for each step
+        """
+        self._step_timings = steps = []
+        started = time.time()
+        try:
+            migration.process_steps(self, direction, force=force)
+        finally:
+            self._step_timings = None
+        return time.time() - started, steps
+
+    def record_step_timing(self, step_id, kind, duration):
+        """
+        Record the time taken by a migration step.
+
+        :param kind: 'sql' for steps given as SQL, or 'python' for steps
+                     given as python functions
+        """
+        if self._step_timings is not None:
+            self._step_timings.append((step_id, kind, duration))
+
     def unmark_one(self, migration, log=True):
         self.ensure_internal_schema_updated()
         sql = self.unmark_migration_sql.format(self)
         self.execute(sql, {"migration_hash": migration.hash})
+        self.execute(self.increment_generation_sql.format(self))
         if log:
             self.log_migration(migration, "unmark")
 
@@ -528,18 +1355,210 @@ class DatabaseBackend(object):
                 "when": datetime.utcnow(),
             },
         )
+        self.execute(self.increment_generation_sql.format(self))
         if log:
             self.log_migration(migration, "mark")
 
-    def log_migration(self, migration, operation, comment=None):
+    def iter_log(self, since=None, migration=None, operation=None, page_size=500):
+        """
+        Generate log entries, oldest first, as dicts keyed by
+        :attr:`log_columns`.
+
+        Entries are read in pages of ``page_size``. Each page is a separate
+        short query, so reading a long history neither loads it into memory
+        nor holds a transaction open.
+
+        :param since: only return entries created at or after this datetime
+        :param migration: only return entries for this migration, given as a
+                          :class:`~yoyo.migrations.Migration` or migration id
+        :param operation: only return entries for this operation, eg 'apply'
+        """
+        self.ensure_internal_schema_updated()
+        conditions = []
+        params = {}
+        if since is not None:
+            conditions.append("created_at_utc >= :since")
+            params["since"] = since
+        if migration is not None:
+            conditions.append("migration_hash = :migration_hash")
+            params["migration_hash"] = getattr(
+                migration, "hash", None
+            ) or get_migration_hash(migration)
+        if operation is not None:
+            conditions.append("operation = :operation")
+            params["operation"] = operation
+        for page in self._iter_log_pages(conditions, params, page_size):
+            for entry in page:
+                yield entry
+
+    def get_durations(self, migrations, operation="apply", batch_size=500):
+        """
+        Return a dict of ``{migration_id: duration_ms}`` giving the time
+        taken by the most recent ``operation`` of each of ``migrations``
+        recorded in the log.
+
+        Entries are looked up by migration hash, ``batch_size`` migrations
+        per query, so only the log entries of ``migrations`` are read.
+
+        This does not upgrade yoyo's internal schema, which must be at
+        least version 4.
+        """
+        durations = {}
+        migrations = list(migrations)
+        for ix in range(0, len(migrations), batch_size):
+            hashes = {
+                "hash{}".format(n): m.hash
+                for n, m in enumerate(migrations[ix : ix + batch_size])
+            }
+            params = dict(hashes, operation=operation)
+            with self.transaction():
+                cursor = self.execute(
+                    "SELECT migration_id, duration_ms FROM {0.log_table_quoted} "
+                    "WHERE operation = :operation "
+                    "AND duration_ms IS NOT NULL "
+                    "AND migration_hash IN ({1}) "
+                    "ORDER BY created_at_utc, id".format(
+                        self, ", ".join(":" + name for name in hashes)
+                    ),
+                    params,
+                )
+                for migration_id, duration_ms in cursor.fetchall():
+                    durations[migration_id] = duration_ms
+        return durations
+
+    def _iter_log_pages(self, conditions, params, page_size):
+        """
+        Generate pages of log entries matching all of the SQL ``conditions``.
+
+        Pages are read by keyset pagination on ``(created_at_utc, id)``:
+        each page resumes after the last entry of the previous one, so
+        entries may be deleted between pages.
+        """
+        keyset = (
+            "(created_at_utc > :last_created_at "
+            "OR (created_at_utc = :last_created_at AND id > :last_id))"
+        )
+        params = dict(params)
+        while True:
+            where = conditions + ([keyset] if "last_id" in params else [])
+            sql = "SELECT {} FROM {} {} ORDER BY created_at_utc, id {}".format(
+                ", ".join(self.log_columns),
+                self.log_table_quoted,
+                "WHERE " + " AND ".join(where) if where else "",
+                self.limit_sql.format(limit=page_size),
+            )
+            with self.transaction():
+                cursor = self.execute(sql, params)
+                page = [
+                    dict(zip(self.log_columns, row))
+                    for row in cursor.fetchmany(page_size)
+                ]
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            params["last_created_at"] = page[-1]["created_at_utc"]
+            params["last_id"] = page[-1]["id"]
+
+    def prune_log(self, before, batch_size=500, archive=None):
+        """
+        Delete log entries created before ``before``.
+
+        Entries are deleted in batches of ``batch_size``, each batch in its
+        own short transaction. The entries recording how each currently
+        applied migration came to be applied are never deleted.
+
+        :param archive: a callable, called with a list of dicts (one per
+                        entry) before each batch is deleted
+        :return: the number of entries deleted
+        """
+        self.ensure_internal_schema_updated()
+        keep = self._get_applied_log_ids()
+        deleted = 0
+        pages = self._iter_log_pages(
+            ["created_at_utc < :before"], {"before": before}, batch_size
+        )
+        for page in pages:
+            rows = [row for row in page if row["id"] not in keep]
+            if not rows:
+                continue
+            with self.transaction():
+                if archive:
+                    archive(rows)
+                ids = {"id{}".format(ix): row["id"] for ix, row in enumerate(rows)}
+                placeholders = ", ".join(":" + name for name in ids)
+                self.execute(
+                    "DELETE FROM {0.step_log_table_quoted} "
+                    "WHERE log_id IN ({1})".format(self, placeholders),
+                    ids,
+                )
+                self.execute(
+                    "DELETE FROM {0.log_table_quoted} WHERE id IN ({1})".format(
+                        self, placeholders
+                    ),
+                    ids,
+                )
+            deleted += len(rows)
+        return deleted
+
+    def _get_applied_log_ids(self):
+        """
+        Return the ids of the most recent 'apply' or 'mark' log entries of
+        each currently applied migration.
+        """
+        cursor = self.execute(
+            "SELECT l.id, l.migration_hash, l.created_at_utc "
+            "FROM {0.log_table_quoted} l "
+            "JOIN {0.migration_table_quoted} m "
+            "ON l.migration_hash = m.migration_hash "
+            "WHERE l.operation IN ('apply', 'mark')".format(self)
+        )
+        latest = {}
+        for id, migration_hash, created_at in cursor.fetchall():
+            if migration_hash not in latest or (created_at, id) > latest[
+                migration_hash
+            ]:
+                latest[migration_hash] = (created_at, id)
+        return {id for created_at, id in latest.values()}
+
+    def log_migration(
+        self, migration, operation, comment=None, duration=None, steps=None
+    ):
         sql = self.log_migration_sql.format(self)
-        self.execute(sql, self.get_log_data(migration, operation, comment))
+        log_data = self.get_log_data(migration, operation, comment, duration, steps)
+        self.execute(sql, log_data)
+        if steps:
+            self.executemany(
+                self.log_step_sql.format(self),
+                [
+                    {
+                        "log_id": log_data["id"],
+                        "step_id": step_id,
+                        "kind": kind,
+                        "duration_ms": to_ms(step_duration),
+                    }
+                    for step_id, kind, step_duration in steps
+                ],
+            )
 
-    def get_log_data(self, migration=None, operation="apply", comment=None):
+    def get_log_data(
+        self, migration=None, operation="apply", comment=None, duration=None, steps=None
+    ):
         """
         Return a dict of data for insertion into the ``_yoyo_log`` table
+
+        :param duration: time taken by the operation, in seconds
+        :param steps: list of ``(step_id, kind, duration)`` tuples for each
+                      step run by the operation
         """
         assert operation in {"apply", "rollback", "mark", "unmark"}
+        if steps is None:
+            sql_step_ms = python_step_ms = None
+        else:
+            sql_step_ms = to_ms(sum(d for _, kind, d in steps if kind == "sql"))
+            python_step_ms = to_ms(
+                sum(d for _, kind, d in steps if kind == "python")
+            )
         return {
             "id": str(uuid.uuid1()),
             "migration_id": migration.id if migration else None,
@@ -549,11 +1568,16 @@ class DatabaseBackend(object):
             "created_at_utc": datetime.utcnow(),
             "operation": operation,
             "comment": comment,
+            "duration_ms": None if duration is None else to_ms(duration),
+            "run_id": self._run_id,
+            "sql_step_ms": sql_step_ms,
+            "python_step_ms": python_step_ms,
         }
 
 
 class ODBCBackend(DatabaseBackend):
     driver_module = "pyodbc"
+    explain_sql = None
 
     def connect(self, dburi):
         args = [
@@ -572,6 +1596,9 @@ class OracleBackend(DatabaseBackend):
 
     driver_module = "cx_Oracle"
     list_tables_sql = "SELECT table_name FROM all_tables WHERE owner=user"
+    limit_sql = "FETCH FIRST {limit:d} ROWS ONLY"
+    # EXPLAIN PLAN writes to a plan table rather than returning rows
+    explain_sql = None
 
     def begin(self):
         """Oracle is always in a transaction, and has no "BEGIN" statement."""
@@ -641,8 +1668,87 @@ class MySQLBackend(DatabaseBackend):
         kwargs["db"] = dburi.database
         return self.driver.connect(**kwargs)
 
+    index_exists_sql = (
+        "SELECT COUNT(1) FROM information_schema.statistics "
+        "WHERE table_schema = :database AND table_name = :table "
+        "AND index_name = :name"
+    )
+
+    def create_index(self, table, columns):
+        """
+        Create an index on ``table`` unless it already exists. MySQL has no
+        ``CREATE INDEX IF NOT EXISTS``. InnoDB builds the index in place
+        without blocking writes.
+        """
+        name = self.get_index_name(table, columns)
+        cursor = self.execute(
+            self.index_exists_sql,
+            {"database": self.uri.database, "table": table, "name": name},
+        )
+        if cursor.fetchone()[0]:
+            return
+        self.execute(
+            "CREATE INDEX {} ON {} ({})".format(
+                self.quote_identifier(name),
+                self.quote_identifier(table),
+                ", ".join(self.quote_identifier(c) for c in columns),
+            )
+        )
+
+    def _get_lock_name(self):
+        """
+        Return the name for ``GET_LOCK``. Named locks are server wide, so this
+        must include the database name, and may be at most 64 characters.
+        """
+        name = "yoyo_lock:{}".format(self.uri.database)
+        if self.lock_name != default_migration_table:
+            name = "{}:{}".format(name, self.lock_name)
+        if len(name) > 64:
+            name = "yoyo_lock:{}".format(
+                hashlib.sha256(name.encode("utf-8")).hexdigest()[:54]
+            )
+        return name
+
+    def _acquire_lock(self, pid, timeout):
+        """
+        Acquire a named lock with ``GET_LOCK``. The server queues waiters
+        and wakes them as soon as the lock is released, and the lock is
+        released automatically should the holding session die.
+        """
+        name = self._get_lock_name()
+        self._lock_attempts += 1
+        cursor = self.execute(
+            "SELECT GET_LOCK(:name, :timeout)",
+            {"name": name, "timeout": int(math.ceil(timeout)) if timeout else -1},
+        )
+        if cursor.fetchone()[0] == 1:
+            return
+        holder = self.execute(
+            "SELECT IS_USED_LOCK(:name)", {"name": name}
+        ).fetchone()[0]
+        raise exceptions.LockTimeout(
+            "MySQL connection {} has locked this database".format(holder)
+        )
+
+    def _try_acquire_lock(self, pid):
+        self._lock_attempts += 1
+        cursor = self.execute(
+            "SELECT GET_LOCK(:name, 0)", {"name": self._get_lock_name()}
+        )
+        return cursor.fetchone()[0] == 1
+
+    def _lock_is_free(self):
+        cursor = self.execute(
+            "SELECT IS_FREE_LOCK(:name)", {"name": self._get_lock_name()}
+        )
+        return cursor.fetchone()[0] == 1
+
+    def _release_lock(self, pid):
+        self.execute("SELECT RELEASE_LOCK(:name)", {"name": self._get_lock_name()})
+
     def quote_identifier(self, identifier):
-        sql_mode = self.execute("SHOW VARIABLES LIKE 'sql_mode'").fetchone()[1]
+        with self.categorize("introspection"):
+            sql_mode = self.execute("SHOW VARIABLES LIKE 'sql_mode'").fetchone()[1]
         if "ansi_quotes" in sql_mode.lower():
             return super(MySQLBackend).quote_identifier(identifier)
         return "`{}`".format(identifier)
@@ -656,6 +1762,7 @@ class SQLiteBackend(DatabaseBackend):
 
     driver_module = "sqlite3"
     list_tables_sql = "SELECT name FROM sqlite_master WHERE type = 'table'"
+    explain_sql = "EXPLAIN QUERY PLAN "
 
     def connect(self, dburi):
         conn = self.driver.connect(
@@ -669,6 +1776,24 @@ class PostgresqlBackend(DatabaseBackend):
 
     driver_module = "psycopg2"
     schema = None
+
+    #: First key of the two-key form of ``pg_advisory_lock``, reserving a
+    #: key space for yoyo ('yoyo' as a 32 bit integer)
+    advisory_lock_namespace = 0x796F796F
+
+    create_index_sql = "CREATE INDEX CONCURRENTLY {name} ON {table} ({columns})"
+
+    index_valid_sql = (
+        "SELECT i.indisvalid FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    )
+
+    #: Number of statements sent to the server at a time by
+    #: :meth:`executemany`
+    executemany_page_size = 1000
+
+    _listening = False
     list_tables_sql = (
         "SELECT table_name FROM information_schema.tables "
         "WHERE table_schema = :schema"
@@ -696,6 +1821,106 @@ class PostgresqlBackend(DatabaseBackend):
             yield
             self.connection.autocommit = saved
 
+    def _executemany(self, cursor, sql, params_seq):
+        """
+        psycopg2's ``executemany`` makes a round trip to the server for each
+        set of parameters. ``execute_batch`` sends them in pages instead.
+        ``cursor.rowcount`` is then that of the last statement only.
+        """
+        extras = get_dbapi_module("psycopg2.extras")
+        extras.execute_batch(
+            cursor, sql, params_seq, page_size=self.executemany_page_size
+        )
+
+    def _get_advisory_lock_key(self):
+        return {"namespace": self.advisory_lock_namespace, "key": self._get_lock_id()}
+
+    def create_index(self, table, columns):
+        """
+        Create an index on ``table`` without blocking writes, unless it
+        already exists.
+
+        An interrupted ``CREATE INDEX CONCURRENTLY`` leaves behind an
+        invalid index, which is dropped and built again.
+        """
+        name = self.get_index_name(table, columns)
+        row = self.execute(self.index_valid_sql, {"name": name}).fetchone()
+        if row and row[0]:
+            return
+        if row:
+            self.execute(
+                "DROP INDEX CONCURRENTLY {}".format(self.quote_identifier(name))
+            )
+        super(PostgresqlBackend, self).create_index(table, columns)
+
+    def _acquire_lock(self, pid, timeout):
+        """
+        Acquire a session level advisory lock, which is released
+        automatically should the holding session die.
+
+        The lock is polled with ``pg_try_advisory_lock`` rather than waited
+        for with ``pg_advisory_lock``, so that waiters hold no open
+        transaction or snapshot: the lock holder may run
+        ``CREATE INDEX CONCURRENTLY``, which waits for every older snapshot
+        to be released. Waiters are woken early by the ``NOTIFY`` sent on
+        release.
+        """
+        self._acquire_lock_unless_ready(pid, lambda: False, timeout)
+
+    def _try_acquire_lock(self, pid):
+        self._lock_attempts += 1
+        with self.transaction():
+            cursor = self.execute(
+                "SELECT pg_try_advisory_lock(:namespace, :key)",
+                self._get_advisory_lock_key(),
+            )
+            return cursor.fetchone()[0]
+
+    def _lock_is_free(self):
+        with self.transaction():
+            cursor = self.execute(
+                "SELECT COUNT(1) FROM pg_locks "
+                "WHERE locktype = 'advisory' AND granted "
+                "AND database = (SELECT oid FROM pg_database "
+                "WHERE datname = current_database()) "
+                "AND classid = :namespace AND objid = :key AND objsubid = 2",
+                self._get_advisory_lock_key(),
+            )
+            return cursor.fetchone()[0] == 0
+
+    def _release_lock(self, pid):
+        with self.transaction():
+            self.execute(
+                "SELECT pg_advisory_unlock(:namespace, :key)",
+                self._get_advisory_lock_key(),
+            )
+            # Wake any processes waiting in lock_or_wait
+            self.execute("NOTIFY {}".format(self._get_lock_channel()))
+
+    def _get_lock_channel(self):
+        return "yoyo_lock_{}".format(self._get_lock_id())
+
+    def _wait_for_lock_release(self, timeout):
+        """
+        Wait for the NOTIFY sent when the lock is released
+        """
+        if not self._listening:
+            with self.transaction():
+                self.execute("LISTEN {}".format(self._get_lock_channel()))
+            self._listening = True
+
+        # Notifications are only delivered outside of a transaction
+        self.commit()
+        if select.select([self.connection], [], [], timeout) != ([], [], []):
+            self.connection.poll()
+            del self.connection.notifies[:]
+
+    def _stop_waiting_for_lock_release(self):
+        if self._listening:
+            with self.transaction():
+                self.execute("UNLISTEN {}".format(self._get_lock_channel()))
+            self._listening = False
+
     def init_connection(self, connection):
         if self.schema:
             cursor = connection.cursor()
@@ -707,6 +1932,10 @@ class PostgresqlBackend(DatabaseBackend):
         )
 
 
+def to_ms(seconds):
+    return int(seconds * 1000)
+
+
 def get_dbapi_module(name):
     """
     Import and return the named DB-API driver module
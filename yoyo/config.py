@@ -15,6 +15,7 @@
 """
 Handle config file and argument parsing
 """
+import argparse
 import os
 import iniherit
 import sys
@@ -43,6 +44,10 @@ def update_argparser_defaults(parser, defaults):
     """
     known_args = {action.dest for action in parser._actions}
     parser.set_defaults(**{k: v for k, v in defaults.items() if k in known_args})
+    for action in parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            for subparser in action.choices.values():
+                update_argparser_defaults(subparser, defaults)
 
 
 def read_config(path):
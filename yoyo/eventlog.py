@@ -0,0 +1,155 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Log a structured event for each migration, step and SQL statement executed.
+
+:class:`EventLogger` is a backend listener (see :mod:`yoyo.events`) that
+logs one JSON object per event to the ``yoyo.events`` logger at INFO level.
+Events are only serialized if a handler will write them::
+
+    logging.getLogger('yoyo.events').addHandler(logging.FileHandler(path))
+    backend.add_listener(EventLogger())
+
+Each event has ``event`` ('run', 'migration', 'step' or 'statement'),
+``time`` (UTC, ISO 8601), ``run_id``, ``duration_ms`` and ``error``
+(``null`` on success), plus:
+
+``run``
+    ``operation`` and ``migrations``, the number of migrations in the run
+``migration``
+    ``operation``, ``migration_id`` and ``migration_hash``
+``step``
+    ``operation``, ``migration_id``, ``step_id`` and ``kind``
+``statement``
+    ``migration_id`` of the migration being applied or rolled back, if
+    any, ``step_id`` if run by a SQL step, ``sql``, truncated to
+    ``max_statement_length`` characters, and ``rowcount``
+"""
+from datetime import datetime
+from logging import getLogger, Formatter, INFO
+import json
+import logging
+import sys
+
+from yoyo.backends import to_ms
+from yoyo.events import Scope
+
+logger = getLogger("yoyo.events")
+
+#: Names of the events logged
+LOGGED_EVENTS = {"run", "migration", "step", "execute"}
+
+
+class EventLogger(object):
+    """
+    :param logger: the logger to write events to
+    :param max_statement_length: the length at which statement text is
+                                 truncated
+    """
+
+    def __init__(self, logger=logger, max_statement_length=500):
+        self.logger = logger
+        self.max_statement_length = max_statement_length
+        self.scope = Scope()
+
+    def __call__(self, event):
+        # Track the migration and step that enclose statements, even when
+        # nothing is logged
+        self.scope.update(event)
+        if (
+            event.phase == "before"
+            or event.name not in LOGGED_EVENTS
+            or not self.logger.isEnabledFor(INFO)
+        ):
+            return
+        self.logger.info(
+            "%s",
+            LazyJSON(
+                self.get_event_data,
+                event,
+                datetime.utcnow(),
+                self.scope.migration_id,
+                self.scope.step_id,
+            ),
+        )
+
+    def get_event_data(self, event, time, migration_id, step_id):
+        data = event.data
+        result = {
+            "event": "statement" if event.name == "execute" else event.name,
+            "time": time.isoformat() + "Z",
+            "run_id": event.backend.run_id,
+            "duration_ms": to_ms(event.duration),
+            "error": None if event.succeeded else str(event.error),
+        }
+        if event.name == "run":
+            result["operation"] = data["operation"]
+            result["migrations"] = len(data["migrations"])
+        elif event.name == "migration":
+            result["operation"] = data["operation"]
+            result["migration_id"] = data["migration"].id
+            result["migration_hash"] = data["migration"].hash
+        elif event.name == "step":
+            result["operation"] = data["operation"]
+            result["migration_id"] = migration_id
+            result["step_id"] = data["step_id"]
+            result["kind"] = data["kind"]
+        else:
+            result["migration_id"] = migration_id
+            result["step_id"] = step_id
+            result["sql"] = truncate(data["sql"], self.max_statement_length)
+            result["rowcount"] = data.get("rowcount")
+        return result
+
+
+class LazyJSON(object):
+    """
+    Serialize ``get_data(*args)`` as JSON when formatted
+    """
+
+    def __init__(self, get_data, *args):
+        self.get_data = get_data
+        self.args = args
+
+    def __str__(self):
+        return json.dumps(self.get_data(*self.args), default=str)
+
+
+def truncate(s, length):
+    if s is None or len(s) <= length:
+        return s
+    return s[:length] + "..."
+
+
+def open_event_log(path):
+    """
+    Send events logged to the ``yoyo.events`` logger to ``path``, or to
+    stderr if ``path`` is '-', one JSON object per line, and return the
+    handler.
+    """
+    if path == "-":
+        handler = logging.StreamHandler(sys.stderr)
+    else:
+        handler = logging.FileHandler(path)
+    handler.setFormatter(Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(INFO)
+    logger.propagate = False
+    return handler
+
+
+def close_event_log(handler):
+    logger.removeHandler(handler)
+    handler.close()
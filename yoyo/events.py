@@ -0,0 +1,128 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Events emitted by a backend while it applies and rolls back migrations.
+
+Register a listener with
+:meth:`~yoyo.backends.DatabaseBackend.add_listener`. Listeners are called
+with an :class:`Event` before and after each of:
+
+``run``
+    Applying or rolling back a list of migrations. ``data`` has
+    ``migrations`` and ``operation`` ('apply' or 'rollback')
+``migration``
+    Applying or rolling back a single migration, including updating yoyo's
+    own tables. ``data`` has ``migration`` and ``operation``
+``step``
+    Running a migration step. ``data`` has ``step_id``, ``kind`` ('sql' or
+    'python') and ``operation``
+``execute``
+    Executing a SQL statement, whether run by yoyo or by a SQL migration
+    step. ``data`` has ``sql`` and ``params``, and on success ``rowcount``.
+    ``executemany`` has ``many=True``
+``commit``, ``rollback``
+    Committing or rolling back a transaction
+``lock``
+    Acquiring the migration lock, including any time spent waiting for
+    another process to release it. After the lock is acquired, ``data`` has
+    ``attempts``, the number of times yoyo tried to take the lock, and
+    ``acquired``, which is False if :meth:`lock_or_wait
+    <yoyo.backends.DatabaseBackend.lock_or_wait>` returned without taking
+    the lock
+
+Events for SQL statements that a python step runs on the connection itself
+are not emitted.
+"""
+from contextlib import contextmanager
+import time
+
+
+class Event(object):
+    """
+    :ivar backend: the backend emitting the event
+    :ivar name: the event name, eg 'execute'
+    :ivar phase: 'before' or 'after'
+    :ivar data: a dict of details, depending on the event name
+    :ivar duration: for 'after' events, the time taken in seconds
+    :ivar error: for 'after' events, the exception raised, if any
+    """
+
+    def __init__(self, backend, name, phase, data, duration=None, error=None):
+        self.backend = backend
+        self.name = name
+        self.phase = phase
+        self.data = data
+        self.duration = duration
+        self.error = error
+
+    def __repr__(self):
+        return "<Event {} {} {!r}>".format(self.phase, self.name, self.data)
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+@contextmanager
+def emit(backend, name, **data):
+    """
+    Notify the listeners registered on ``backend`` before and after the
+    ``with`` block. The block may add to the ``data`` dict that is yielded,
+    eg to record a result.
+
+    Callers check ``backend.listeners is not None`` first, so that nothing
+    is done when there are no listeners.
+    """
+    listeners = backend.listeners
+    notify(listeners, Event(backend, name, "before", data))
+    started = time.time()
+    try:
+        yield data
+    except BaseException as e:
+        notify(
+            listeners,
+            Event(backend, name, "after", data, time.time() - started, e),
+        )
+        raise
+    notify(listeners, Event(backend, name, "after", data, time.time() - started))
+
+
+class Scope(object):
+    """
+    Track the migration and step in progress, for listeners that report
+    statements in context. Call :meth:`update` with every event.
+
+    :ivar migration: the migration being applied or rolled back, if any
+    :ivar step_id: the id of the step running, if any
+    """
+
+    migration = None
+    step_id = None
+
+    def update(self, event):
+        before = event.phase == "before"
+        if event.name == "migration":
+            self.migration = event.data["migration"] if before else None
+        elif event.name == "step":
+            self.step_id = event.data["step_id"] if before else None
+
+    @property
+    def migration_id(self):
+        return self.migration.id if self.migration else None
+
+
+def notify(listeners, event):
+    for listener in listeners or ():
+        listener(event)
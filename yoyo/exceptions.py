@@ -35,3 +35,9 @@ class LockTimeout(Exception):
     """
     Timeout was reached while acquiring the migration lock
     """
+
+
+class LockLost(Exception):
+    """
+    Another process took over the migration lock while it was held
+    """
@@ -6,15 +6,21 @@ from datetime import datetime
 
 from . import v1
 from . import v2
+from . import v3
+from . import v4
+from . import v5
 
 
 #: Mapping of {schema version number: module}
-schema_versions = {0: None, 1: v1, 2: v2}
+schema_versions = {0: None, 1: v1, 2: v2, 3: v3, 4: v4, 5: v5}
 
 
 #: First schema version that supports the yoyo_versions table
 USE_VERSION_TABLE_FROM = 2
 
+#: First schema version that records migration durations in the log table
+LOG_DURATIONS_FROM = 4
+
 
 def needs_upgrading(backend):
     return get_current_version(backend) < max(schema_versions)
@@ -30,12 +36,21 @@ def upgrade(backend, version=None):
     else:
         desired_version = version
     current_version = get_current_version(backend)
-    with backend.transaction():
-        while current_version < desired_version:
-            next_version = current_version + 1
-            schema_versions[next_version].upgrade(backend)
-            current_version = next_version
-            mark_schema_version(backend, current_version)
+    while current_version < desired_version:
+        next_version = current_version + 1
+        module = schema_versions[next_version]
+        if getattr(module, "__transactional__", True):
+            with backend.transaction():
+                module.upgrade(backend)
+                mark_schema_version(backend, next_version)
+        else:
+            # Versions that run outside a transaction must be safe to rerun
+            # if interrupted before being marked as applied.
+            with backend.disable_transactions():
+                module.upgrade(backend)
+            with backend.transaction():
+                mark_schema_version(backend, next_version)
+        current_version = next_version
 
 
 def get_current_version(backend):
@@ -3,8 +3,13 @@ Version 2 schema.
 
 Compatible with yoyo-migrations >=  6.0
 """
+import uuid
+
 from yoyo.migrations import get_migration_hash
 
+#: Number of legacy rows to copy to the log table in each batch
+BATCH_SIZE = 1000
+
 
 def upgrade(backend):
     create_log_table(backend)
@@ -12,26 +17,37 @@ def upgrade(backend):
     cursor = backend.execute(
         "SELECT id, ctime FROM {}".format(backend.migration_table_quoted)
     )
-    for migration_id, created_at in iter(cursor.fetchone, None):
-        migration_hash = get_migration_hash(migration_id)
-        log_data = dict(
-            backend.get_log_data(),
-            operation="apply",
-            comment=(
-                "this log entry created automatically by an " "internal schema upgrade"
-            ),
-            created_at_utc=created_at,
-            migration_hash=migration_hash,
-            migration_id=migration_id,
-        )
-        backend.execute(
-            "INSERT INTO {0.log_table_quoted} "
-            "(id, migration_hash, migration_id, operation, created_at_utc, "
-            "username, hostname, comment) "
-            "VALUES "
-            "(:id, :migration_hash, :migration_id, 'apply', :created_at_utc, "
-            ":username, :hostname, :comment)".format(backend),
-            log_data,
+    log_data = dict(
+        backend.get_log_data(),
+        operation="apply",
+        comment=(
+            "this log entry created automatically by an " "internal schema upgrade"
+        ),
+    )
+    insert_sql = (
+        "INSERT INTO {0.log_table_quoted} "
+        "(id, migration_hash, migration_id, operation, created_at_utc, "
+        "username, hostname, comment) "
+        "VALUES "
+        "(:id, :migration_hash, :migration_id, 'apply', :created_at_utc, "
+        ":username, :hostname, :comment)".format(backend)
+    )
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        backend.executemany(
+            insert_sql,
+            [
+                dict(
+                    log_data,
+                    id=str(uuid.uuid1()),
+                    created_at_utc=created_at,
+                    migration_hash=get_migration_hash(migration_id),
+                    migration_id=migration_id,
+                )
+                for migration_id, created_at in rows
+            ],
         )
 
     backend.execute("DROP TABLE {0.migration_table_quoted}".format(backend))
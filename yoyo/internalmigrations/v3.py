@@ -0,0 +1,22 @@
+"""
+Version 3 schema.
+
+Adds a single row table holding a generation counter, incremented whenever
+a migration is marked or unmarked.
+"""
+
+
+def upgrade(backend):
+    create_generation_table(backend)
+    backend.execute(
+        "INSERT INTO {0.generation_table_quoted} (generation) VALUES (0)".format(
+            backend
+        )
+    )
+
+
+def create_generation_table(backend):
+    backend.execute(
+        "CREATE TABLE {0.generation_table_quoted} ("
+        "generation INT NOT NULL)".format(backend)
+    )
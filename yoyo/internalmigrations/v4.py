@@ -0,0 +1,42 @@
+"""
+Version 4 schema.
+
+Adds a ``duration_ms`` column to the log table, and indexes for looking up
+log entries by migration and date and for ordering applied migrations.
+
+Indexes are built outside a transaction so that backends able to build them
+without blocking writes (eg PostgreSQL's ``CREATE INDEX CONCURRENTLY``) can
+do so. Each step first checks whether it has already been done, so that
+an interrupted upgrade can be run again. An interrupted
+``CREATE INDEX CONCURRENTLY`` leaves an invalid index behind, which
+:meth:`~yoyo.backends.PostgresqlBackend.create_index` drops and rebuilds.
+"""
+
+__transactional__ = False
+
+
+def upgrade(backend):
+    if not has_column(backend, backend.log_table, "duration_ms"):
+        backend.execute(
+            "ALTER TABLE {0.log_table_quoted} ADD COLUMN duration_ms INT".format(
+                backend
+            )
+        )
+    backend.create_index(backend.log_table, ["migration_hash"])
+    backend.create_index(backend.log_table, ["created_at_utc"])
+    backend.create_index(backend.migration_table, ["applied_at_utc"])
+
+
+def has_column(backend, table, column):
+    # The column name is not quoted: SQLite treats a quoted name that matches
+    # no column as a string literal
+    try:
+        with backend.categorize("introspection"):
+            backend.execute(
+                "SELECT {} FROM {} WHERE 1 = 0".format(
+                    column, backend.quote_identifier(table)
+                )
+            ).fetchall()
+    except backend.DatabaseError:
+        return False
+    return True
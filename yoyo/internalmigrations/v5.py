@@ -0,0 +1,46 @@
+"""
+Version 5 schema.
+
+Adds columns to the log table recording the run each entry belongs to (ie
+the call to apply, rollback, mark or unmark migrations) and how long the
+operation spent in SQL steps and in Python steps, and a table recording the
+duration of each step.
+
+Databases without transactional DDL (eg MySQL) commit each statement, so
+this runs outside a transaction and, as in version 4, each step first checks
+whether it has already been done so that an interrupted upgrade can be run
+again.
+"""
+
+from .v4 import has_column
+
+__transactional__ = False
+
+
+def upgrade(backend):
+    for column, type in [
+        ("run_id", "VARCHAR(36)"),
+        ("sql_step_ms", "INT"),
+        ("python_step_ms", "INT"),
+    ]:
+        if not has_column(backend, backend.log_table, column):
+            backend.execute(
+                "ALTER TABLE {0.log_table_quoted} ADD COLUMN {1} {2}".format(
+                    backend, column, type
+                )
+            )
+    if backend.step_log_table not in backend.list_tables():
+        create_step_log_table(backend)
+
+
+def create_step_log_table(backend):
+    backend.execute(
+        "CREATE TABLE {0.step_log_table_quoted} ( "
+        # The _yoyo_log entry of the operation
+        "log_id VARCHAR(36), "
+        "step_id INT, "
+        # 'sql' or 'python'
+        "kind VARCHAR(10), "
+        "duration_ms INT, "
+        "PRIMARY KEY (log_id, step_id))".format(backend)
+    )
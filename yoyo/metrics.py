@@ -0,0 +1,242 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Export metrics about a run of migrations in the Prometheus text format, for
+the node exporter's textfile collector::
+
+    exporter = PrometheusExporter()
+    backend.add_listener(exporter)
+    try:
+        backend.apply_migrations(backend.to_apply(migrations))
+    finally:
+        exporter.write('/var/lib/node_exporter/yoyo.prom')
+"""
+from collections import OrderedDict
+import os
+import tempfile
+import time
+
+#: Histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    300,
+    float("inf"),
+)
+
+replace_file = getattr(os, "replace", os.rename)
+
+
+class Metric(object):
+
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = OrderedDict()
+
+    def lines(self):
+        yield "# HELP {} {}".format(self.name, self.help)
+        yield "# TYPE {} {}".format(self.name, self.type)
+        for labelvalues, value in self.values.items():
+            for line in self.sample_lines(labelvalues, value):
+                yield line
+
+    def format_sample(self, name, labels, value):
+        if labels:
+            name += "{%s}" % ",".join(
+                '{}="{}"'.format(
+                    k,
+                    str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\""),
+                )
+                for k, v in labels
+            )
+        return "{} {}".format(name, format_value(value))
+
+
+class Counter(Metric):
+
+    type = "counter"
+
+    def inc(self, amount=1, *labelvalues):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def sample_lines(self, labelvalues, value):
+        labels = list(zip(self.labelnames, labelvalues))
+        yield self.format_sample(self.name, labels, value)
+
+
+class Gauge(Counter):
+
+    type = "gauge"
+
+    def set(self, value, *labelvalues):
+        self.values[labelvalues] = value
+
+
+class Histogram(Metric):
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, *labelvalues):
+        counts, total = self.values.get(labelvalues, ([0] * len(self.buckets), 0))
+        for ix, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[ix] += 1
+        self.values[labelvalues] = (counts, total + value)
+
+    def sample_lines(self, labelvalues, value):
+        counts, total = value
+        labels = list(zip(self.labelnames, labelvalues))
+        for bound, count in zip(self.buckets, counts):
+            yield self.format_sample(
+                self.name + "_bucket", labels + [("le", format_value(bound))], count
+            )
+        yield self.format_sample(self.name + "_sum", labels, total)
+        yield self.format_sample(self.name + "_count", labels, counts[-1])
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class PrometheusExporter(object):
+    """
+    A backend listener (see :mod:`yoyo.events`) that collects metrics for
+    the migrations run while it is registered.
+
+    Statements executed by yoyo itself, and commits and rollbacks, are
+    counted as bookkeeping round trips. Statements run by SQL migration
+    steps are counted separately.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.migrations = Counter(
+            "yoyo_migrations_total",
+            "Migrations applied or rolled back",
+            ("operation", "outcome"),
+        )
+        self.step_duration = Histogram(
+            "yoyo_step_duration_seconds",
+            "Time taken by migration steps",
+            ("operation", "kind"),
+            buckets,
+        )
+        self.lock_wait = Histogram(
+            "yoyo_lock_wait_seconds",
+            "Time spent acquiring the migration lock",
+            buckets=buckets,
+        )
+        self.lock_attempts = Counter(
+            "yoyo_lock_attempts_total", "Attempts to acquire the migration lock"
+        )
+        self.statements = Counter(
+            "yoyo_statements_total", "SQL statements executed by migration steps"
+        )
+        self.bookkeeping = Counter(
+            "yoyo_bookkeeping_round_trips_total",
+            "Statements, commits and rollbacks issued by yoyo itself",
+        )
+        self.last_run = Gauge(
+            "yoyo_last_run_timestamp_seconds",
+            "When the metrics were written, as a unix timestamp",
+        )
+        for metric in [self.lock_attempts, self.statements, self.bookkeeping]:
+            metric.inc(0)
+        self._step_depth = 0
+
+    def __call__(self, event):
+        name = event.name
+        if name == "step":
+            if event.phase == "before":
+                self._step_depth += 1
+                return
+            self._step_depth -= 1
+            self.step_duration.observe(
+                event.duration, event.data["operation"], event.data["kind"]
+            )
+        elif event.phase == "before":
+            return
+        elif name == "execute":
+            if self._step_depth:
+                self.statements.inc()
+            else:
+                self.bookkeeping.inc()
+        elif name in ("commit", "rollback"):
+            self.bookkeeping.inc()
+        elif name == "migration":
+            self.migrations.inc(
+                1,
+                event.data["operation"],
+                "success" if event.succeeded else "failure",
+            )
+        elif name == "lock":
+            self.lock_wait.observe(event.duration)
+            self.lock_attempts.inc(event.data.get("attempts", 0))
+
+    @property
+    def metrics(self):
+        return [
+            self.migrations,
+            self.step_duration,
+            self.lock_wait,
+            self.lock_attempts,
+            self.statements,
+            self.bookkeeping,
+            self.last_run,
+        ]
+
+    def render(self):
+        """
+        Return the metrics in the Prometheus text format
+        """
+        self.last_run.set(time.time())
+        return "".join(line + "\n" for m in self.metrics for line in m.lines())
+
+    def write(self, path):
+        """
+        Write the metrics to ``path``, replacing it atomically so that a
+        partially written file is never scraped.
+        """
+        fd, tmppath = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.chmod(tmppath, 0o644)
+            replace_file(tmppath, path)
+        except Exception:
+            os.unlink(tmppath)
+            raise
@@ -27,8 +27,10 @@ import hashlib
 import os
 import sys
 import inspect
+import time
 
 from yoyo.compat import reraise, exec_, ustr, stdout
+from yoyo import events
 from yoyo import exceptions
 from yoyo.utils import plural
 
@@ -125,15 +127,22 @@ class Migration(object):
         else:
             transaction = backend.disable_transactions
 
+        # Check before the transaction begins: the check can't run in a
+        # transaction aborted by a failing step
+        undo_on_failure = (
+            not self.use_transactions or not backend.has_transactional_ddl
+        )
+
         with transaction():
             for step in steps:
                 try:
                     getattr(step, direction)(backend, force)
                     executed_steps.append(step)
+                    backend.renew_lock_lease()
                 except backend.DatabaseError:
                     exc_info = sys.exc_info()
 
-                    if not backend.has_transactional_ddl or not self.use_transactions:
+                    if undo_on_failure:
                         # Any DDL statements that have been executed have been
                         # committed. Go through the rollback steps to undo
                         # these inasmuch is possible.
@@ -183,11 +192,20 @@ class TransactionWrapper(StepBase):
         return "<TransactionWrapper {!r}>".format(self.step)
 
     def apply(self, backend, force=False, direction="apply"):
+        ignore_errors = force or self.ignore_errors in (direction, "all")
+
+        # A failure will abort the enclosing transaction anyway, so there is
+        # no need to pay for a savepoint round trip we would never roll back
+        # to.
+        if not ignore_errors and backend.in_transaction:
+            getattr(self.step, direction)(backend, force)
+            return
+
         with backend.transaction() as transaction:
             try:
                 getattr(self.step, direction)(backend, force)
             except backend.DatabaseError:
-                if force or self.ignore_errors in (direction, "all"):
+                if ignore_errors:
                     logger.exception("Ignored error in %r", self.step)
                     transaction.rollback()
                     return
@@ -276,32 +294,47 @@ class MigrationStep(StepBase):
         :param force: If true, errors will be logged but not be re-raised
         """
         logger.info(" - applying step %d", self.id)
-        if not self._apply:
+        self._run(backend, self._apply, "apply")
+
+    def _run(self, backend, step, operation):
+        """
+        Run the SQL or python function ``step`` and record its duration
+        """
+        if not step:
             return
-        if isinstance(self._apply, (ustr, str)):
-            cursor = backend.cursor()
-            try:
-                self._execute(cursor, self._apply)
-            finally:
-                cursor.close()
-        else:
-            self._apply(backend.connection)
+        kind = "sql" if isinstance(step, (ustr, str)) else "python"
+        started = time.time()
+        with backend.categorize("step"):
+            if backend.listeners is None:
+                self._run_step(backend, step, kind)
+            else:
+                with events.emit(
+                    backend, "step", step_id=self.id, kind=kind, operation=operation
+                ):
+                    self._run_step(backend, step, kind)
+        backend.record_step_timing(self.id, kind, time.time() - started)
+
+    def _run_step(self, backend, step, kind):
+        if kind == "python":
+            step(backend.connection)
+            return
+        cursor = backend.cursor()
+        try:
+            if backend.listeners is None:
+                self._execute(cursor, step)
+            else:
+                with events.emit(backend, "execute", sql=step, params=None) as data:
+                    self._execute(cursor, step)
+                    data["rowcount"] = cursor.rowcount
+        finally:
+            cursor.close()
 
     def rollback(self, backend, force=False):
         """
         Rollback the step.
         """
         logger.info(" - rolling back step %d", self.id)
-        if self._rollback is None:
-            return
-        if isinstance(self._rollback, (ustr, str)):
-            cursor = backend.cursor()
-            try:
-                self._execute(cursor, self._rollback)
-            finally:
-                cursor.close()
-        else:
-            self._rollback(backend.connection)
+        self._run(backend, self._rollback, "rollback")
 
 
 class StepGroup(MigrationStep):
@@ -0,0 +1,125 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Estimate how long it will take to apply a set of migrations, from the
+durations recorded when they were applied elsewhere (eg in a staging
+environment).
+"""
+import gzip
+import io
+import json
+
+
+def get_durations_from_backend(backend, operation="apply", migrations=None):
+    """
+    Return a dict of ``{migration_id: duration_ms}`` giving the time taken
+    by the most recent apply (or ``operation``) of each migration recorded
+    in the log of ``backend``.
+
+    :param migrations: only look up the durations of these migrations. This
+                       reads only their log entries, rather than the whole
+                       log.
+    """
+    if migrations is not None:
+        return backend.get_durations(migrations, operation)
+    return get_durations_from_log(backend.iter_log(operation=operation), operation)
+
+
+def get_durations_from_file(path):
+    """
+    Return a dict of ``{migration_id: duration_ms}`` read from a JSON lines
+    file of log entries, as written by ``yoyo history --format json`` or
+    ``yoyo log prune --export``. The file may be gzip compressed.
+    """
+    opener = gzip.open if path.endswith(".gz") else io.open
+    with opener(path, "rb") as f:
+        return get_durations_from_log(
+            json.loads(line.decode("utf-8")) for line in f if line.strip()
+        )
+
+
+def get_durations_from_log(entries, operation="apply"):
+    durations = {}
+    for entry in entries:
+        if entry.get("operation") == operation and entry.get("duration_ms") is not None:
+            durations[entry["migration_id"]] = entry["duration_ms"]
+    return durations
+
+
+class Plan(object):
+    """
+    Estimated timings for applying a list of migrations.
+
+    :ivar estimates: list of ``(migration, duration_ms)`` tuples, in the
+                     order the migrations will be applied. ``duration_ms``
+                     is ``None`` for migrations with no recorded duration.
+    :ivar critical_path: the chain of dependent migrations with the longest
+                         total estimated duration
+    """
+
+    def __init__(self, estimates, critical_path):
+        self.estimates = estimates
+        self.critical_path = critical_path
+
+    @property
+    def duration_ms(self):
+        """
+        Estimated total time to apply all migrations, ignoring migrations
+        with no recorded duration
+        """
+        return sum(d for m, d in self.estimates if d is not None)
+
+    @property
+    def unknown(self):
+        """
+        Migrations with no recorded duration
+        """
+        return [m for m, d in self.estimates if d is None]
+
+    @property
+    def critical_path_ms(self):
+        durations = dict((m, d or 0) for m, d in self.estimates)
+        return sum(durations[m] for m in self.critical_path)
+
+
+def analyze(migrations, durations):
+    """
+    Return a :class:`Plan` for applying ``migrations``.
+
+    :param migrations: the migrations to apply, in order, eg as returned by
+                       :meth:`~yoyo.backends.DatabaseBackend.to_apply`
+    :param durations: a dict of ``{migration_id: duration_ms}``
+    """
+    estimates = [(m, durations.get(m.id)) for m in migrations]
+
+    # Longest path through the dependency graph, mapping each migration to
+    # ``((total_ms, length), previous)``. Migrations are in dependency order,
+    # so each migration's dependencies have already been visited. Ties are
+    # broken by the number of migrations in the chain.
+    longest = {}
+    for m, duration in estimates:
+        deps = [d for d in m.depends if d in longest]
+        previous = max(deps, key=lambda d: longest[d][0]) if deps else None
+        total, length = longest[previous][0] if previous else (0, 0)
+        longest[m] = ((total + (duration or 0), length + 1), previous)
+
+    critical_path = []
+    if longest:
+        m = max(longest, key=lambda m: longest[m][0])
+        while m is not None:
+            critical_path.append(m)
+            m = longest[m][1]
+    critical_path.reverse()
+    return Plan(estimates, critical_path)
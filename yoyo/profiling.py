@@ -0,0 +1,103 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Profile migrations with :mod:`cProfile`::
+
+    backend.apply_migrations(migrations, profile='/tmp/profiles')
+
+writes a ``.pstats`` file for each python step to ``/tmp/profiles``, and a
+``summary.txt`` listing the functions taking the most time across all of
+them. Inspect a profile with :mod:`pstats` or a viewer such as snakeviz.
+"""
+from collections import Counter
+import cProfile
+import io
+import os
+import pstats
+
+from yoyo.compat import PY2
+from yoyo.events import Scope
+
+#: Name of the summary file written by :class:`Profiler`
+SUMMARY_FILENAME = "summary.txt"
+
+
+class Profiler(object):
+    """
+    A backend listener (see :mod:`yoyo.events`) that profiles each python
+    migration step, or each whole migration, and writes the profiles to
+    ``directory``. Call :meth:`write_summary` once done.
+
+    :param by: 'step' to profile each python step, or 'migration' to
+               profile each migration, including its SQL steps and yoyo's
+               bookkeeping
+    :param top: the number of functions listed in the summary
+    :ivar paths: the profiles written
+    """
+
+    def __init__(self, directory, by="step", top=30):
+        if by not in ("step", "migration"):
+            raise ValueError("by must be 'step' or 'migration'")
+        self.directory = directory
+        self.by = by
+        self.top = top
+        self.paths = []
+        self.scope = Scope()
+        self._profile = None
+        self._names = Counter()
+
+    def __call__(self, event):
+        name = event.name
+        if name == self.by and (
+            name == "migration" or event.data["kind"] == "python"
+        ):
+            if event.phase == "before":
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+            elif self._profile is not None:
+                self._profile.disable()
+                self.save(self._profile, event)
+                self._profile = None
+        # Updated last, so that the migration is still known when its
+        # profile is saved
+        self.scope.update(event)
+
+    def save(self, profile, event):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        name = "{}-{}".format(self.scope.migration_id, event.data["operation"])
+        if self.by == "step":
+            name += "-step{}".format(event.data["step_id"])
+        self._names[name] += 1
+        if self._names[name] > 1:
+            name += "-{}".format(self._names[name])
+        path = os.path.join(self.directory, name + ".pstats")
+        profile.dump_stats(path)
+        self.paths.append(path)
+
+    def write_summary(self):
+        """
+        Write the functions taking the most cumulative time across all
+        profiles to ``summary.txt``
+        """
+        if not self.paths:
+            return
+        out = io.BytesIO() if PY2 else io.StringIO()
+        stats = pstats.Stats(*self.paths, stream=out)
+        stats.sort_stats("cumulative").print_stats(self.top)
+        with open(os.path.join(self.directory, SUMMARY_FILENAME), "w") as f:
+            f.write("Profiles:\n")
+            f.writelines("  {}\n".format(path) for path in self.paths)
+            f.write(out.getvalue())
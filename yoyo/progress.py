@@ -0,0 +1,303 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Report the progress of applying or rolling back migrations.
+
+A :class:`ProgressReporter` listens to a backend's events (see
+:mod:`yoyo.events`) and passes each change in progress to a sink, which
+renders it::
+
+    backend.add_listener(ProgressReporter(TTYSink()))
+    backend.apply_migrations(backend.to_apply(migrations))
+
+The estimated time remaining is based on the durations recorded in the
+migration log, when there are any.
+"""
+from __future__ import division
+
+import json
+import sys
+import time
+
+from yoyo.plan import get_durations_from_backend
+
+#: Names accepted by :func:`get_sink`
+SINKS = ["auto", "bar", "log", "json", "none"]
+
+
+class ProgressReporter(object):
+    """
+    Track the progress of a run of migrations and report it to ``sink``.
+
+    :param sink: an object with an ``update(event, progress)`` method, eg
+                 :class:`TTYSink`
+    :param durations: a dict of ``{migration_id: duration_ms}`` used to
+                      estimate the time remaining. By default durations are
+                      read from the migration log when the run starts, from
+                      the log entries of the migrations in the run only.
+
+    :ivar operation: 'apply' or 'rollback'
+    :ivar total: the number of migrations in the run
+    :ivar done: the number of migrations completed
+    :ivar current: the migration in progress, if any
+    :ivar steps_done: the number of steps of ``current`` completed
+    """
+
+    def __init__(self, sink, durations=None):
+        self.sink = sink
+        self.durations = durations
+        self.running = False
+        self.operation = None
+        self.total = self.done = self.steps_done = 0
+        self.current = None
+        self.succeeded = None
+
+    def __call__(self, event):
+        if event.name == "run":
+            if event.phase == "before":
+                self.start(
+                    event.backend, event.data["migrations"], event.data["operation"]
+                )
+            else:
+                self.finish(event.succeeded)
+        elif not event.succeeded:
+            return
+        elif event.name == "migration":
+            if event.phase == "before":
+                self.migration_started(event.data["migration"])
+            else:
+                self.migration_finished(event.data["migration"])
+        elif event.name == "step" and event.phase == "after":
+            self.step_finished(event.data["step_id"])
+
+    def start(self, backend, migrations, operation):
+        durations = self.durations
+        if durations is None:
+            durations = get_durations_from_backend(backend, operation, migrations)
+        self._durations = durations
+        self._remaining_ms = 0
+        self._remaining_unknown = 0
+        for m in migrations:
+            if m.id in durations:
+                self._remaining_ms += durations[m.id]
+            else:
+                self._remaining_unknown += 1
+        known = [durations[m.id] for m in migrations if m.id in durations]
+        self._historical_mean_ms = sum(known) / len(known) if known else None
+        self._actual_ms = self._actual_count = 0
+        self._estimate_ms = None
+
+        self.running = True
+        self.operation = operation
+        self.total = len(migrations)
+        self.done = self.steps_done = 0
+        self.current = None
+        self.succeeded = None
+        self.started_at = self.migration_started_at = time.time()
+        self.sink.update("start", self)
+
+    def migration_started(self, migration):
+        if not self.running:
+            return
+        self.current = migration
+        self.steps_done = 0
+        self.migration_started_at = time.time()
+        self._estimate_ms = self._durations.get(migration.id)
+        if self._estimate_ms is None:
+            self._remaining_unknown -= 1
+        else:
+            self._remaining_ms -= self._estimate_ms
+        self.sink.update("migration_started", self)
+
+    def step_finished(self, step_id):
+        if not self.running:
+            return
+        self.steps_done += 1
+        self.sink.update("step_finished", self)
+
+    def migration_finished(self, migration):
+        if not self.running:
+            return
+        self._actual_ms += (time.time() - self.migration_started_at) * 1000
+        self._actual_count += 1
+        self._estimate_ms = 0
+        self.done += 1
+        self.sink.update("migration_finished", self)
+        self.current = None
+
+    def finish(self, succeeded=True):
+        if not self.running:
+            return
+        self.succeeded = succeeded
+        self.sink.update("finish", self)
+        self.running = False
+
+    @property
+    def elapsed(self):
+        """
+        Seconds since the run started
+        """
+        return time.time() - self.started_at
+
+    @property
+    def eta(self):
+        """
+        Estimated seconds remaining, or ``None`` if there is nothing to base
+        an estimate on.
+
+        Migrations without a recorded duration are estimated from the mean
+        duration of the migrations completed so far in this run, or failing
+        that the mean recorded duration.
+        """
+        if self._actual_count:
+            mean_ms = self._actual_ms / self._actual_count
+        else:
+            mean_ms = self._historical_mean_ms
+        current_unknown = self.current is not None and self._estimate_ms is None
+        if mean_ms is None and (self._remaining_unknown or current_unknown):
+            return None
+        remaining_ms = self._remaining_ms + self._remaining_unknown * (mean_ms or 0)
+        if self.current is not None:
+            estimate_ms = mean_ms if self._estimate_ms is None else self._estimate_ms
+            spent_ms = (time.time() - self.migration_started_at) * 1000
+            remaining_ms += max(0, estimate_ms - spent_ms)
+        return remaining_ms / 1000
+
+
+def format_seconds(seconds):
+    """
+    Format a number of seconds as ``M:SS`` or ``H:MM:SS``
+    """
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
+    return "{}:{:02d}".format(minutes, seconds)
+
+
+def describe(progress):
+    """
+    Return a one line summary of ``progress``
+    """
+    parts = ["{}/{}".format(progress.done, progress.total)]
+    if progress.current is not None:
+        parts.append(
+            "{} {} (step {})".format(
+                progress.operation, progress.current.id, progress.steps_done + 1
+            )
+        )
+    parts.append("elapsed {}".format(format_seconds(progress.elapsed)))
+    parts.append("ETA {}".format(format_seconds(progress.eta)))
+    return ", ".join(parts)
+
+
+class TTYSink(object):
+    """
+    Draw a progress bar, redrawn in place at most every ``interval``
+    seconds.
+    """
+
+    def __init__(self, out=None, width=30, interval=0.1):
+        self.out = out or sys.stderr
+        self.width = width
+        self.interval = interval
+        self._drawn_at = 0
+
+    def update(self, event, progress):
+        now = time.time()
+        if event == "step_finished" and now - self._drawn_at < self.interval:
+            return
+        self._drawn_at = now
+        filled = (
+            self.width * progress.done // progress.total if progress.total else 0
+        )
+        bar = "#" * filled + "-" * (self.width - filled)
+        self.out.write("\r[{}] {}\033[K".format(bar, describe(progress)))
+        if event == "finish":
+            self.out.write("\n")
+        self.out.flush()
+
+
+class LogSink(object):
+    """
+    Write a line as each migration starts and when the run finishes. Suited
+    to logs that are not a terminal, eg a CI job's output.
+    """
+
+    def __init__(self, out=None):
+        self.out = out or sys.stderr
+
+    def update(self, event, progress):
+        if event == "migration_started":
+            self.out.write(describe(progress) + "\n")
+        elif event == "finish":
+            self.out.write(
+                "{} {}/{} migrations in {}\n".format(
+                    "Finished" if progress.succeeded else "Failed after",
+                    progress.done,
+                    progress.total,
+                    format_seconds(progress.elapsed),
+                )
+            )
+        else:
+            return
+        self.out.flush()
+
+
+class JSONSink(object):
+    """
+    Write every event as a line of JSON
+    """
+
+    def __init__(self, out=None):
+        self.out = out or sys.stderr
+
+    def update(self, event, progress):
+        eta = progress.eta
+        data = {
+            "event": event,
+            "operation": progress.operation,
+            "done": progress.done,
+            "total": progress.total,
+            "migration": progress.current.id if progress.current else None,
+            "steps_done": progress.steps_done,
+            "elapsed": round(progress.elapsed, 3),
+            "eta": None if eta is None else round(eta, 3),
+        }
+        if event == "finish":
+            data["succeeded"] = progress.succeeded
+        self.out.write(json.dumps(data) + "\n")
+        self.out.flush()
+
+
+def get_sink(name, out=None):
+    """
+    Return the sink called ``name`` (one of :data:`SINKS`), or ``None`` for
+    'none'. 'auto' draws a progress bar if ``out`` is a terminal.
+    """
+    out = out or sys.stderr
+    if name == "auto":
+        name = "bar" if out.isatty() else "none"
+    if name == "bar":
+        return TTYSink(out)
+    if name == "log":
+        return LogSink(out)
+    if name == "json":
+        return JSONSink(out)
+    if name == "none":
+        return None
+    raise ValueError("Unknown progress sink {!r}".format(name))
@@ -0,0 +1,186 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Count the SQL round trips made on a backend's connection::
+
+    with count_statements(backend) as counter:
+        backend.apply_migrations(backend.to_apply(migrations))
+    print(counter.counts)
+    assert_statement_budget(
+        counter, len(migrations), per_item=12, constant=20,
+        category='bookkeeping'
+    )
+
+Statements, commits and rollbacks are counted by the backend's
+:attr:`~yoyo.backends.DatabaseBackend.statement_category` at the time they
+are sent:
+
+``step``
+    Statements run by migration steps, including those a python step runs
+    on the connection itself
+``bookkeeping``
+    Reading and updating yoyo's own tables, and transaction control
+``lock``
+    Acquiring and releasing the migration lock
+``introspection``
+    Probing the database, eg checking whether yoyo's tables need upgrading
+
+Only the backend's main connection is counted. ``executemany`` is counted
+once for each set of parameters, as DB-API drivers may execute the
+statement separately for each. The PostgreSQL backend instead sends
+``executemany`` statements in pages with ``psycopg2.extras.execute_batch``,
+and each page is counted as one ``execute``.
+"""
+from collections import Counter
+from contextlib import contextmanager
+
+#: Operations counted as round trips
+COUNTED = ("execute", "executemany", "commit", "rollback")
+
+
+class StatementCounter(object):
+    """
+    :ivar counts: a :class:`~collections.Counter` of round trips by category
+    :ivar operations: a :class:`~collections.Counter` of round trips by
+                      ``(category, operation)``, where ``operation`` is one
+                      of :data:`COUNTED`
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.operations = Counter()
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def count(self, category, operation):
+        self.counts[category] += 1
+        self.operations[category, operation] += 1
+
+    def install(self, backend):
+        """
+        Wrap ``backend``'s connection so that round trips made on it are
+        counted
+        """
+        if isinstance(backend._connection, CountingConnection):
+            raise ValueError("A StatementCounter is already installed")
+        backend._connection = CountingConnection(backend, self)
+
+    def uninstall(self, backend):
+        backend._connection = backend._connection._connection
+
+
+@contextmanager
+def count_statements(backend):
+    """
+    Count the round trips made on ``backend``'s connection within the block,
+    yielding a :class:`StatementCounter`
+    """
+    counter = StatementCounter()
+    counter.install(backend)
+    try:
+        yield counter
+    finally:
+        counter.uninstall(backend)
+
+
+class CountingConnection(object):
+    """
+    Proxy a DB-API connection, counting commits, rollbacks and the
+    statements executed on its cursors
+    """
+
+    def __init__(self, backend, counter):
+        self.__dict__.update(
+            _backend=backend, _counter=counter, _connection=backend._connection
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self, self._connection.cursor(*args, **kwargs))
+
+    def commit(self):
+        self._count("commit")
+        return self._connection.commit()
+
+    def rollback(self):
+        self._count("rollback")
+        return self._connection.rollback()
+
+    def _count(self, operation):
+        self._counter.count(self._backend.statement_category, operation)
+
+
+class CountingCursor(object):
+    def __init__(self, connection, cursor):
+        self.__dict__.update(_connection=connection, _cursor=cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, *args, **kwargs):
+        self._connection._count("execute")
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, sql, params_seq):
+        params_seq = list(params_seq)
+        for params in params_seq:
+            self._connection._count("executemany")
+        return self._cursor.executemany(sql, params_seq)
+
+
+def format_counts(counter):
+    return ", ".join(
+        "{}={}".format(category, n) for category, n in sorted(counter.counts.items())
+    )
+
+
+def assert_statement_budget(counter, n, per_item, constant, category=None):
+    """
+    Assert that no more than ``per_item * n + constant`` round trips were
+    counted, eg to check that applying ``n`` migrations stays within a
+    budget. Only round trips in ``category`` are considered if given.
+
+    :raises AssertionError: if the budget is exceeded
+    """
+    if category is None:
+        used = counter.total
+    else:
+        used = counter.counts[category]
+    budget = per_item * n + constant
+    if used > budget:
+        raise AssertionError(
+            "{} {}round trips exceeds the budget of {} ({} x {} + {}): {}".format(
+                used,
+                "" if category is None else category + " ",
+                budget,
+                per_item,
+                n,
+                constant,
+                format_counts(counter),
+            )
+        )
@@ -0,0 +1,172 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measure the CPU time, memory and database time used by each migration::
+
+    monitor = ResourceMonitor(trace_allocations=True)
+    backend.add_listener(monitor)
+    backend.apply_migrations(backend.to_apply(migrations))
+    for usage in monitor.usage:
+        print(usage.migration_id, usage.user_cpu_ms, usage.tracemalloc_peak_kb)
+"""
+from collections import namedtuple
+from logging import getLogger
+import os
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from yoyo.backends import to_ms
+
+logger = getLogger("yoyo.migrations")
+
+#: Resources used applying or rolling back a migration.
+#:
+#: ``db_ms`` is the time spent waiting for statements, commits and rollbacks
+#: issued by yoyo and by SQL steps; ``client_ms`` is the rest of
+#: ``duration_ms``, including any queries python steps make on the
+#: connection themselves. ``rss_delta_kb`` is the change in resident set
+#: size, and ``tracemalloc_peak_kb`` the peak memory allocated by python,
+#: if allocations were traced.
+MigrationUsage = namedtuple(
+    "MigrationUsage",
+    [
+        "migration_id",
+        "operation",
+        "duration_ms",
+        "user_cpu_ms",
+        "system_cpu_ms",
+        "rss_delta_kb",
+        "tracemalloc_peak_kb",
+        "db_ms",
+        "client_ms",
+    ],
+)
+
+
+def get_cpu_times():
+    """
+    Return the user and system CPU time used by this process, in seconds
+    """
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime, usage.ru_stime
+    times = os.times()
+    return times[0], times[1]
+
+
+def get_rss_kb():
+    """
+    Return the resident set size of this process in kilobytes, or the peak
+    resident set size where the current size is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (IOError, OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    return maxrss // 1024 if os.uname()[0] == "Darwin" else maxrss
+
+
+class ResourceMonitor(object):
+    """
+    A backend listener (see :mod:`yoyo.events`) recording a
+    :class:`MigrationUsage` for each migration applied or rolled back, and
+    logging it at INFO level.
+
+    :param trace_allocations: if True, trace python memory allocations with
+                              :mod:`tracemalloc` to find the peak allocated
+                              by each migration. This slows python code
+                              down considerably.
+    :ivar usage: list of :class:`MigrationUsage`
+    """
+
+    def __init__(self, trace_allocations=False):
+        if trace_allocations and tracemalloc is None:
+            raise ValueError("tracemalloc is not available")
+        self.trace_allocations = trace_allocations
+        self.usage = []
+        self._started = None
+
+    def __call__(self, event):
+        name = event.name
+        if name == "migration":
+            if event.phase == "before":
+                self.start()
+            elif self._started is not None:
+                self.finish(event.data["migration"], event.data["operation"])
+        elif event.phase == "after" and self._started is not None:
+            if name in ("execute", "commit", "rollback"):
+                self._db_time += event.duration
+
+    def start(self):
+        self._db_time = 0
+        if self.trace_allocations:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            tracemalloc.start()
+        self._rss = get_rss_kb()
+        self._cpu = get_cpu_times()
+        self._started = time.time()
+
+    def finish(self, migration, operation):
+        duration = time.time() - self._started
+        user, system = get_cpu_times()
+        rss = get_rss_kb()
+        peak = None
+        if self.trace_allocations:
+            peak = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        self._started = None
+
+        usage = MigrationUsage(
+            migration.id,
+            operation,
+            to_ms(duration),
+            to_ms(user - self._cpu[0]),
+            to_ms(system - self._cpu[1]),
+            None if rss is None or self._rss is None else rss - self._rss,
+            peak,
+            to_ms(self._db_time),
+            to_ms(max(0, duration - self._db_time)),
+        )
+        self.usage.append(usage)
+        logger.info(
+            "Resources used by %s: %d ms (%d ms database, %d ms client), "
+            "CPU %d ms user %d ms system, RSS %+d kB%s",
+            usage.migration_id,
+            usage.duration_ms,
+            usage.db_ms,
+            usage.client_ms,
+            usage.user_cpu_ms,
+            usage.system_cpu_ms,
+            usage.rss_delta_kb or 0,
+            ""
+            if peak is None
+            else ", python allocations peaked at {} kB".format(peak),
+        )
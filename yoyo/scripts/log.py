@@ -0,0 +1,220 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from datetime import datetime, timedelta
+import argparse
+import gzip
+import json
+
+from yoyo import default_migration_table
+from yoyo import logger
+from yoyo.stats import get_stats
+from yoyo.scripts.main import InvalidArgument, get_backend
+from yoyo.scripts import output
+
+
+def install_argparsers(global_parser, subparsers):
+    database_parser = argparse.ArgumentParser(add_help=False)
+    database_parser.add_argument(
+        "-d",
+        "--database",
+        default=None,
+        help="Database, eg 'sqlite:///path/to/sqlite.db' "
+        "or 'postgresql://user@host/db'",
+    )
+    database_parser.add_argument(
+        "--migration-table",
+        dest="migration_table",
+        action="store",
+        default=default_migration_table,
+        help="Name of table to use for storing " "migration metadata",
+    )
+
+    parser_history = subparsers.add_parser(
+        "history",
+        parents=[global_parser, database_parser],
+        help="Show the migration log, oldest first",
+    )
+    parser_history.set_defaults(func=history, command_name="history")
+    parser_history.add_argument(
+        "--since",
+        type=parse_datetime,
+        help="Show entries created at or after this UTC date or time",
+    )
+    parser_history.add_argument(
+        "--migration", metavar="ID", help="Show entries for this migration id"
+    )
+    parser_history.add_argument(
+        "--operation",
+        choices=["apply", "rollback", "mark", "unmark"],
+        help="Show entries for this operation",
+    )
+    output.add_format_argument(parser_history)
+
+    parser_stats = subparsers.add_parser(
+        "stats",
+        parents=[global_parser, database_parser],
+        help="Show the time taken to apply migrations",
+    )
+    parser_stats.set_defaults(func=stats, command_name="stats")
+    parser_stats.add_argument(
+        "--since",
+        type=parse_datetime,
+        help="Only include migrations applied at or after this UTC date or time",
+    )
+    parser_stats.add_argument(
+        "--limit",
+        type=int,
+        default=10,
+        help="Number of migrations and runs to show",
+    )
+
+    parser_log = subparsers.add_parser(
+        "log", parents=[global_parser], help="Manage the migration log"
+    )
+    log_subparsers = parser_log.add_subparsers(
+        dest="log_command", help="Log commands help"
+    )
+    log_subparsers.required = True
+
+    parser_prune = log_subparsers.add_parser(
+        "prune",
+        parents=[global_parser, database_parser],
+        help="Delete old log entries",
+    )
+    parser_prune.set_defaults(func=prune, command_name="log prune")
+    cutoff = parser_prune.add_mutually_exclusive_group(required=True)
+    cutoff.add_argument(
+        "--before",
+        type=parse_datetime,
+        help="Delete entries created before this UTC date or time, "
+        "eg '2020-01-31' or '2020-01-31T12:00:00'",
+    )
+    cutoff.add_argument(
+        "--older-than",
+        dest="older_than",
+        type=int,
+        metavar="DAYS",
+        help="Delete entries created more than DAYS days ago",
+    )
+    parser_prune.add_argument(
+        "--export",
+        metavar="PATH",
+        help="Append deleted entries to a gzip compressed JSON lines file",
+    )
+    parser_prune.add_argument(
+        "--batch-size",
+        dest="batch_size",
+        type=int,
+        default=500,
+        help="Number of entries to delete in each transaction",
+    )
+
+
+def parse_datetime(s):
+    for format in ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(s, format)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("invalid date: {!r}".format(s))
+
+
+def history(args, config):
+    backend = get_backend(args, config)
+    entries = backend.iter_log(
+        since=args.since, migration=args.migration, operation=args.operation
+    )
+    if args.format == "table":
+        columns = ["created_at_utc", "operation", "migration_id", "username"]
+        writer = output.get_writer(
+            args.format,
+            ["Date (UTC)", "Operation", "Migration", "User"],
+            widths=[26, 9, 40, 0],
+        )
+    else:
+        columns = backend.log_columns
+        writer = output.get_writer(args.format, columns)
+    for entry in entries:
+        writer.writerow([entry[c] for c in columns])
+
+
+def stats(args, config):
+    result = get_stats(get_backend(args, config), since=args.since)
+
+    print("Slowest migrations")
+    writer = output.get_writer(
+        "table",
+        [
+            "Migration",
+            "Duration (ms)",
+            "SQL steps (ms)",
+            "Python steps (ms)",
+            "Applied (UTC)",
+        ],
+        widths=[max([len(t.migration_id) for t in result.migrations] or [0])],
+    )
+    for t in result.migrations[: args.limit]:
+        writer.writerow(
+            [
+                t.migration_id,
+                t.duration_ms,
+                t.sql_step_ms,
+                t.python_step_ms,
+                t.applied_at,
+            ]
+        )
+
+    print("\nRecent runs")
+    writer = output.get_writer(
+        "table", ["Started (UTC)", "Migrations", "Duration (ms)"], widths=[26]
+    )
+    for run in result.runs[-args.limit :]:
+        writer.writerow([run.started_at, run.migrations, run.duration_ms])
+
+    print("\nTime spent applying migrations")
+    writer = output.get_writer("table", ["Spent in", "ms", "%"], widths=[12, 8])
+    for label, ms in [
+        ("SQL steps", result.sql_step_ms),
+        ("Python steps", result.python_step_ms),
+        ("Other", result.other_ms),
+        ("Total", result.duration_ms),
+    ]:
+        percent = 100.0 * ms / result.duration_ms if result.duration_ms else 0
+        writer.writerow([label, ms, "{:.1f}".format(percent)])
+
+
+def prune(args, config):
+    if args.batch_size < 1:
+        raise InvalidArgument("--batch-size must be at least 1")
+    if args.before:
+        before = args.before
+    else:
+        before = datetime.utcnow() - timedelta(days=args.older_than)
+
+    backend = get_backend(args, config)
+    if args.export:
+        with gzip.open(args.export, "ab") as f:
+
+            def archive(rows):
+                for row in rows:
+                    line = json.dumps(row, default=output.to_text) + "\n"
+                    f.write(line.encode("utf-8"))
+
+            deleted = backend.prune_log(before, args.batch_size, archive)
+    else:
+        deleted = backend.prune_log(before, args.batch_size)
+    logger.info("Deleted %d log entries created before %s", deleted, before)
@@ -62,6 +62,13 @@ def parse_args(argv=None):
         "database": "get",
         "verbosity": "getint",
         "migration_table": "get",
+        "wait_for_leader": "getboolean",
+        "lock_name": "get",
+        "progress": "get",
+        "metrics_file": "get",
+        "event_log": "get",
+        "slow_statement_threshold": "getint",
+        "slow_statement_report": "get",
     }
 
     globalparser, argparser, subparsers = make_argparser()
@@ -87,8 +94,6 @@ def parse_args(argv=None):
     # Set the argparser defaults to values read from the config file
     update_argparser_defaults(globalparser, defaults)
     update_argparser_defaults(argparser, defaults)
-    for subp in subparsers.choices.values():
-        update_argparser_defaults(subp, defaults)
 
     # Now parse for real, starting from the top
     args = argparser.parse_args(argv)
@@ -140,10 +145,11 @@ def make_argparser():
 
     subparsers = argparser.add_subparsers(help="Commands help")
 
-    from . import migrate, newmigration
+    from . import log, migrate, newmigration
 
     migrate.install_argparsers(global_parser, subparsers)
     newmigration.install_argparsers(global_parser, subparsers)
+    log.install_argparsers(global_parser, subparsers)
 
     return global_parser, argparser, subparsers
 
@@ -262,7 +268,9 @@ def get_backend(args, config):
     except AttributeError:
         pass
 
-    return connections.get_backend(dburi, migration_table)
+    return connections.get_backend(
+        dburi, migration_table, lock_name=getattr(args, "lock_name", None)
+    )
 
 
 def main(argv=None):
@@ -293,13 +301,15 @@ def main(argv=None):
             return main(argv)
 
     try:
-        args.func(args, config)
+        status = args.func(args, config)
     except InvalidArgument as e:
         argparser.error(e.args[0])
 
     if config_is_empty and args.use_config_file and not args.batch_mode:
         prompt_save_config(config, args.config or CONFIG_FILENAME)
 
+    return status
+
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))
@@ -12,13 +12,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from contextlib import contextmanager
 import argparse
+import os
 import re
 import warnings
-from tabulate import tabulate
 
 from yoyo import read_migrations, default_migration_table, ancestors, descendants
 from yoyo.scripts.main import InvalidArgument, get_backend
+from yoyo.scripts import output
+from yoyo import connections
+from yoyo import eventlog
+from yoyo import internalmigrations
+from yoyo import logger
+from yoyo import metrics
+from yoyo import plan
+from yoyo import profiling
+from yoyo import resources
+from yoyo import progress
+from yoyo import slowlog
 from yoyo import utils
 
 
@@ -76,6 +88,13 @@ def install_argparsers(global_parser, subparsers):
         help="Name of table to use for storing " "migration metadata",
     )
 
+    migration_parser.add_argument(
+        "--lock-name",
+        dest="lock_name",
+        default=None,
+        help="Name of the migration lock (defaults to the migration table name)",
+    )
+
     migration_parser.add_argument(
         "-r",
         "--revision",
@@ -83,25 +102,136 @@ def install_argparsers(global_parser, subparsers):
         metavar="REVISION",
     )
 
+    reporting_parser = argparse.ArgumentParser(add_help=False)
+    reporting_parser.add_argument(
+        "--progress",
+        choices=progress.SINKS,
+        default="auto",
+        help="Report progress as a progress bar, log lines or JSON events "
+        "on stderr. The default, 'auto', shows a progress bar if stderr is a "
+        "terminal",
+    )
+    reporting_parser.add_argument(
+        "--metrics-file",
+        dest="metrics_file",
+        metavar="PATH",
+        help="Write Prometheus metrics for the run to PATH, eg for the node "
+        "exporter's textfile collector",
+    )
+    reporting_parser.add_argument(
+        "--event-log",
+        dest="event_log",
+        metavar="PATH",
+        help="Append a JSON object to PATH for each migration, step and SQL "
+        "statement executed. Use '-' for stderr",
+    )
+    reporting_parser.add_argument(
+        "--slow-statement-threshold",
+        dest="slow_statement_threshold",
+        type=int,
+        metavar="MS",
+        help="Log a warning for SQL statements taking longer than MS "
+        "milliseconds, capturing the execution plan of DML statements",
+    )
+    reporting_parser.add_argument(
+        "--slow-statement-report",
+        dest="slow_statement_report",
+        metavar="PATH",
+        help="Append slow statements and their execution plans to PATH",
+    )
+    reporting_parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Profile python migration steps with cProfile, writing a .pstats "
+        "file for each and a summary of the slowest functions to DIR",
+    )
+    reporting_parser.add_argument(
+        "--profile-by",
+        dest="profile_by",
+        choices=["step", "migration"],
+        default="step",
+        help="With --profile, profile each python step (the default) or each "
+        "whole migration",
+    )
+    reporting_parser.add_argument(
+        "--resource-usage",
+        dest="resource_usage",
+        action="store_true",
+        help="Show the CPU time, memory and database time used by each "
+        "migration",
+    )
+    reporting_parser.add_argument(
+        "--trace-allocations",
+        dest="trace_allocations",
+        action="store_true",
+        help="With --resource-usage, trace python memory allocations to show "
+        "the peak allocated by each migration. This slows python steps down",
+    )
+
     parser_apply = subparsers.add_parser(
-        "apply", help="Apply migrations", parents=[global_parser, migration_parser]
+        "apply",
+        help="Apply migrations",
+        parents=[global_parser, migration_parser, reporting_parser],
     )
     parser_apply.set_defaults(func=apply, command_name="apply")
+    parser_apply.add_argument(
+        "--wait-for-leader",
+        dest="wait_for_leader",
+        action="store_true",
+        help="If another process is already applying migrations, wait for it "
+        "to finish instead of queueing for the migration lock",
+    )
+    parser_apply.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="Show the migrations that would be applied and an estimate of "
+        "how long they will take, without applying them",
+    )
+    parser_apply.add_argument(
+        "--timings-from",
+        dest="timings_from",
+        metavar="SOURCE",
+        help="With --dry-run, estimate durations from the migration log of "
+        "this database, or from a JSON lines file as written by "
+        "'yoyo history --format json'. Defaults to the target database",
+    )
 
-    parser_apply = subparsers.add_parser(
+    parser_show = subparsers.add_parser(
         "showmigrations", help="Show migrations", parents=[global_parser, migration_parser]
     )
-    parser_apply.set_defaults(func=show_migrations, command_name="showmigrations")
+    parser_show.set_defaults(func=show_migrations, command_name="showmigrations")
+    output.add_format_argument(parser_show)
+    parser_show.add_argument(
+        "--dependency-order",
+        dest="dependency_order",
+        action="store_true",
+        help="List migrations in dependency order rather than by id. This "
+        "loads every migration script",
+    )
+
+    parser_check = subparsers.add_parser(
+        "check",
+        help="Check whether the database is up to date. Exits with status 0 "
+        "if it is, {} if migrations are pending, or {} if the database has "
+        "applied migrations not found in the sources".format(
+            CHECK_PENDING, CHECK_UNKNOWN_APPLIED
+        ),
+        parents=[global_parser, migration_parser],
+    )
+    parser_check.set_defaults(func=check, command_name="check")
 
     parser_rollback = subparsers.add_parser(
         "rollback",
-        parents=[global_parser, migration_parser],
+        parents=[global_parser, migration_parser, reporting_parser],
         help="Rollback migrations",
     )
     parser_rollback.set_defaults(func=rollback, command_name="rollback")
 
     parser_reapply = subparsers.add_parser(
-        "reapply", parents=[global_parser, migration_parser], help="Reapply migrations"
+        "reapply",
+        parents=[global_parser, migration_parser, reporting_parser],
+        help="Reapply migrations",
     )
     parser_reapply.set_defaults(func=reapply, command_name="reapply")
 
@@ -130,21 +260,51 @@ def install_argparsers(global_parser, subparsers):
         help="Database, eg 'sqlite:///path/to/sqlite.db' "
         "or 'postgresql://user@host/db'",
     )
+    parser_break_lock.add_argument(
+        "--migration-table",
+        dest="migration_table",
+        action="store",
+        default=default_migration_table,
+        help="Break the lock for migrations stored in this table",
+    )
+    parser_break_lock.add_argument(
+        "--lock-name",
+        dest="lock_name",
+        default=None,
+        help="Name of the migration lock to break "
+        "(defaults to the migration table name)",
+    )
 
 
-def get_migrations(args, backend):
-    sources = args.sources
-    dburi = args.database
+#: Exit status of ``yoyo check`` when migrations are pending
+CHECK_PENDING = 3
 
-    if not sources:
+#: Exit status of ``yoyo check`` when the database has applied migrations
+#: not found in the sources
+CHECK_UNKNOWN_APPLIED = 4
+
+
+def read_source_migrations(args):
+    """
+    Return the migrations found in the source directories given in ``args``,
+    filtered by ``--match``.
+    """
+    if not args.sources:
         raise InvalidArgument("Please specify the migration source directory")
 
-    migrations = read_migrations(*sources)
+    migrations = read_migrations(*args.sources)
 
     if args.match:
         migrations = migrations.filter(
             lambda m: re.search(args.match, m.id) is not None
         )
+    return migrations
+
+
+def get_migrations(args, backend):
+    dburi = args.database
+
+    migrations = read_source_migrations(args)
 
     if not args.all:
         if args.func in {apply, mark}:
@@ -153,9 +313,6 @@ def get_migrations(args, backend):
         elif args.func in {rollback, reapply, unmark}:
             migrations = backend.to_rollback(migrations)
 
-        elif args.func == show_migrations:
-            return backend.get_migrations_with_applied_status(migrations)
-
     if args.revision:
         targets = [m for m in migrations if args.revision in m.id]
         if len(targets) == 0:
@@ -216,25 +373,226 @@ def get_migrations(args, backend):
 
 def apply(args, config):
     backend = get_backend(args, config)
-    with backend.lock():
-        migrations = get_migrations(args, backend)
-        backend.apply_migrations(migrations, args.force)
+
+    if args.dry_run:
+        show_plan(args, backend)
+        return
+
+    with reporting(args, backend):
+        if args.all:
+            with backend.lock():
+                apply_selected_migrations(args, backend)
+            return
+
+        # Avoid queueing on the lock when the database is already up to date.
+        # The migrations to apply are computed again once the lock is held.
+        sources = read_source_migrations(args)
+
+        def is_up_to_date():
+            return not backend.has_unapplied(sources)
+
+        if is_up_to_date():
+            return
+
+        if args.wait_for_leader:
+            with backend.lock_or_wait(is_up_to_date) as locked:
+                if locked:
+                    apply_selected_migrations(args, backend)
+        else:
+            with backend.lock():
+                apply_selected_migrations(args, backend)
+
+
+def apply_selected_migrations(args, backend):
+    migrations = get_migrations(args, backend)
+    backend.apply_migrations(migrations, args.force)
+
+
+@contextmanager
+def reporting(args, backend):
+    """
+    Register the progress reporter, metrics exporter, event log, slow
+    statement log, profiler and resource monitor requested in ``args`` for
+    the duration of the block
+    """
+    sink = progress.get_sink(args.progress)
+    if sink is not None:
+        backend.add_listener(progress.ProgressReporter(sink))
+    exporter = event_log = profiler = monitor = None
+    if args.metrics_file:
+        exporter = metrics.PrometheusExporter()
+        backend.add_listener(exporter)
+    if args.event_log:
+        event_log = eventlog.open_event_log(args.event_log)
+        backend.add_listener(eventlog.EventLogger())
+    if args.slow_statement_threshold is not None:
+        backend.add_listener(
+            slowlog.SlowStatementLog(
+                args.slow_statement_threshold, args.slow_statement_report
+            )
+        )
+    if args.profile:
+        profiler = profiling.Profiler(args.profile, by=args.profile_by)
+        backend.add_listener(profiler)
+    if args.resource_usage:
+        monitor = resources.ResourceMonitor(args.trace_allocations)
+        backend.add_listener(monitor)
+    try:
+        yield
+    finally:
+        if event_log:
+            eventlog.close_event_log(event_log)
+        if exporter:
+            exporter.write(args.metrics_file)
+        if profiler:
+            profiler.write_summary()
+        if monitor and monitor.usage:
+            show_resource_usage(monitor.usage)
+
+
+def show_resource_usage(usage):
+    writer = output.get_writer(
+        "table",
+        [
+            "Migration",
+            "Operation",
+            "Duration (ms)",
+            "Database (ms)",
+            "Client (ms)",
+            "User CPU (ms)",
+            "System CPU (ms)",
+            "RSS change (kB)",
+            "Python peak (kB)",
+        ],
+        widths=[max(len(u.migration_id) for u in usage)],
+    )
+    for u in usage:
+        writer.writerow(
+            [
+                u.migration_id,
+                u.operation,
+                u.duration_ms,
+                u.db_ms,
+                u.client_ms,
+                u.user_cpu_ms,
+                u.system_cpu_ms,
+                "" if u.rss_delta_kb is None else u.rss_delta_kb,
+                "" if u.tracemalloc_peak_kb is None else u.tracemalloc_peak_kb,
+            ]
+        )
+
+
+def show_plan(args, backend):
+    """
+    Print the migrations that ``apply`` would apply, with their estimated
+    durations and the longest chain of dependent migrations.
+    """
+    args.batch_mode = True
+    migrations = get_migrations(args, backend)
+    source = args.timings_from
+    if source is None:
+        durations = plan.get_durations_from_backend(backend, migrations=migrations)
+    elif os.path.exists(source):
+        durations = plan.get_durations_from_file(source)
+    else:
+        # Only read from the source database: upgrading its internal schema
+        # would take its migration lock and run DDL there
+        source_backend = connections.get_backend(source)
+        version = internalmigrations.get_current_version(source_backend)
+        if version < internalmigrations.LOG_DURATIONS_FROM:
+            raise InvalidArgument(
+                "{} does not record migration durations: its yoyo internal "
+                "schema is at version {} (version {} is needed). Run a newer "
+                "yoyo against it first".format(
+                    source, version, internalmigrations.LOG_DURATIONS_FROM
+                )
+            )
+        durations = plan.get_durations_from_backend(
+            source_backend, migrations=migrations
+        )
+    result = plan.analyze(migrations, durations)
+
+    writer = output.get_writer(
+        "table",
+        ["Migration", "Estimate (ms)"],
+        widths=[max([len(m.id) for m in migrations] or [0])],
+    )
+    for m, duration in result.estimates:
+        writer.writerow([m.id, "unknown" if duration is None else duration])
+    print(
+        "\nEstimated total: {} ms for {}".format(
+            result.duration_ms,
+            utils.plural(len(migrations), "%d migration", "%d migrations"),
+        )
+    )
+    if result.unknown:
+        print(
+            "No recorded duration for {}".format(
+                utils.plural(len(result.unknown), "%d migration", "%d migrations")
+            )
+        )
+    if result.critical_path:
+        print(
+            "Longest dependency chain ({} ms): {}".format(
+                result.critical_path_ms,
+                " -> ".join(m.id for m in result.critical_path),
+            )
+        )
 
 
 def show_migrations(args, config):
+    """
+    List migrations and whether each has been applied, most recent first.
+
+    Unless ``--dependency-order`` is given, this only reads migration ids and
+    the applied migration hashes: it does not load any migration scripts,
+    nor take the migration lock, so it never waits for a running migration.
+    """
     backend = get_backend(args, config)
-    with backend.lock():
-        migrations = get_migrations(args, backend)
+    migrations = read_source_migrations(args)
+    applied = set(backend.get_applied_migration_hashes())
+    widths = [max([len(m.id) for m in migrations] or [0]), 0]
+    if args.dependency_order:
+        migrations = backend.get_migrations_with_applied_status(migrations)
+    else:
+        migrations = reversed(migrations)
+
+    if args.format == "table":
+        writer = output.get_writer(args.format, ["Migration", "Applied"], widths=widths)
+        for m in migrations:
+            writer.writerow(
+                [
+                    m.id,
+                    "\033[92mYes\033[0m" if m.hash in applied else "\033[91mNo\033[0m",
+                ]
+            )
+    else:
+        writer = output.get_writer(args.format, ["migration", "hash", "applied"])
+        for m in migrations:
+            writer.writerow([m.id, m.hash, m.hash in applied])
 
-        print(tabulate(
-            [(m.id, '\033[92m Yes \033[0m' if m.applied else '\033[91m No \033[0m') for m in migrations],
-            headers=['Migration', 'Applied'])
-        )
+
+def check(args, config):
+    """
+    Report whether the database is up to date with the source migrations,
+    returning the exit status.
+    """
+    backend = get_backend(args, config)
+    result = backend.check(read_source_migrations(args))
+    for m in result.pending:
+        logger.info("Pending: %s", m.id)
+    for migration_id in result.unknown:
+        logger.info("Applied but not found in sources: %s", migration_id)
+    if result.unknown:
+        return CHECK_UNKNOWN_APPLIED
+    if result.pending:
+        return CHECK_PENDING
+    return 0
 
 
 def reapply(args, config):
     backend = get_backend(args, config)
-    with backend.lock():
+    with reporting(args, backend), backend.lock():
         migrations = get_migrations(args, backend)
         backend.rollback_migrations(migrations, args.force)
         migrations = backend.to_apply(migrations)
@@ -243,7 +601,7 @@ def reapply(args, config):
 
 def rollback(args, config):
     backend = get_backend(args, config)
-    with backend.lock():
+    with reporting(args, backend), backend.lock():
         migrations = get_migrations(args, backend)
         backend.rollback_migrations(migrations, args.force)
 
@@ -0,0 +1,101 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Write command output one row at a time, as a text table, JSON lines or CSV.
+
+Rows are written as soon as they are produced, so commands listing many
+rows start printing immediately and never hold the whole output in memory.
+"""
+from __future__ import print_function
+
+from datetime import date, datetime
+import csv
+import json
+import sys
+
+FORMATS = ["table", "json", "csv"]
+
+
+def add_format_argument(parser):
+    parser.add_argument(
+        "--format",
+        dest="format",
+        choices=FORMATS,
+        default="table",
+        help="Output format. 'json' writes one JSON object per line",
+    )
+
+
+def get_writer(format, columns, out=None, widths=None):
+    """
+    Return a row writer for the given format.
+
+    :param columns: list of column names
+    :param out: file-like object to write to (defaults to ``sys.stdout``)
+    :param widths: for the table format, a list of minimum column widths,
+                   from the first column. Values wider than their column are
+                   not truncated.
+    """
+    out = out or sys.stdout
+    if format == "json":
+        return JSONLinesWriter(columns, out)
+    if format == "csv":
+        return CSVWriter(columns, out)
+    return TableWriter(columns, out, widths)
+
+
+def to_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return "{}".format(value)
+
+
+class TableWriter(object):
+    def __init__(self, columns, out, widths=None):
+        self.out = out
+        widths = list(widths or [])
+        widths += [0] * (len(columns) - len(widths))
+        self.widths = [max(len(c), w) for c, w in zip(columns, widths)]
+        self.write_line(columns)
+        self.out.write("  ".join("-" * w for w in self.widths) + "\n")
+
+    def write_line(self, values):
+        cells = [to_text(v).ljust(w) for v, w in zip(values, self.widths)]
+        self.out.write("  ".join(cells).rstrip() + "\n")
+
+    def writerow(self, values):
+        self.write_line(values)
+
+
+class JSONLinesWriter(object):
+    def __init__(self, columns, out):
+        self.columns = columns
+        self.out = out
+
+    def writerow(self, values):
+        self.out.write(
+            json.dumps(dict(zip(self.columns, values)), default=to_text) + "\n"
+        )
+
+
+class CSVWriter(object):
+    def __init__(self, columns, out):
+        self.writer = csv.writer(out, lineterminator="\n")
+        self.writer.writerow(columns)
+
+    def writerow(self, values):
+        self.writer.writerow([to_text(v) for v in values])
@@ -0,0 +1,125 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Log SQL statements that take longer than a threshold, with their execution
+plans::
+
+    backend.add_listener(SlowStatementLog(threshold_ms=1000, report=path))
+"""
+from datetime import datetime
+from logging import getLogger
+import io
+import re
+
+from yoyo.backends import to_ms
+from yoyo.events import Scope
+
+logger = getLogger("yoyo.migrations")
+
+#: Statements for which an execution plan is captured
+dml_pattern = re.compile(
+    r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b", re.IGNORECASE
+)
+
+
+class SlowStatement(object):
+    """
+    A statement that took longer than the threshold.
+
+    :ivar plan: the rows returned by ``EXPLAIN`` (or the backend's
+                equivalent), or ``None`` if no plan was captured
+    :ivar plan_error: the error raised when querying the plan, if any
+    """
+
+    def __init__(self, time, migration_id, step_id, sql, duration_ms):
+        self.time = time
+        self.migration_id = migration_id
+        self.step_id = step_id
+        self.sql = sql
+        self.duration_ms = duration_ms
+        self.plan = None
+        self.plan_error = None
+
+
+class SlowStatementLog(object):
+    """
+    A backend listener (see :mod:`yoyo.events`) that logs a warning for each
+    statement taking longer than ``threshold_ms`` milliseconds.
+
+    For DML statements the execution plan is queried with
+    :meth:`~yoyo.backends.DatabaseBackend.explain` once the statement has
+    completed.
+
+    :param report: a path to append a report of each slow statement and
+                   its plan to
+    :ivar statements: list of :class:`SlowStatement`
+    """
+
+    def __init__(self, threshold_ms, report=None):
+        self.threshold_ms = threshold_ms
+        self.report = report
+        self.statements = []
+        self.scope = Scope()
+
+    def __call__(self, event):
+        self.scope.update(event)
+        if event.name != "execute" or event.phase != "after":
+            return
+        duration_ms = to_ms(event.duration)
+        if duration_ms < self.threshold_ms:
+            return
+        data = event.data
+        slow = SlowStatement(
+            datetime.utcnow(),
+            self.scope.migration_id,
+            self.scope.step_id,
+            data["sql"],
+            duration_ms,
+        )
+        if event.succeeded and not data.get("many") and dml_pattern.match(data["sql"]):
+            backend = event.backend
+            try:
+                slow.plan = backend.explain(data["sql"], data["params"])
+            except backend.DatabaseError as e:
+                slow.plan_error = str(e)
+        self.statements.append(slow)
+        logger.warning(
+            "Slow statement (%d ms) in %s step %s: %s",
+            duration_ms,
+            slow.migration_id or "(no migration)",
+            "-" if slow.step_id is None else slow.step_id,
+            slow.sql,
+        )
+        if self.report:
+            with io.open(self.report, "a", encoding="utf-8") as f:
+                f.write(format_slow_statement(slow))
+
+
+def format_slow_statement(slow):
+    lines = [
+        u"-- {}Z migration {} step {}: {} ms".format(
+            slow.time.isoformat(),
+            slow.migration_id or "(none)",
+            "(none)" if slow.step_id is None else slow.step_id,
+            slow.duration_ms,
+        ),
+        slow.sql.strip(),
+    ]
+    if slow.plan is not None:
+        lines.append(u"-- plan:")
+        lines.extend(u"--   " + u" | ".join(str(v) for v in row) for row in slow.plan)
+    elif slow.plan_error:
+        lines.append(u"-- plan unavailable: {}".format(slow.plan_error))
+    return u"\n".join(lines) + u"\n\n"
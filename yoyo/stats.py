@@ -0,0 +1,121 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Summarize the timings recorded in the migration log.
+"""
+from collections import namedtuple, OrderedDict
+from datetime import timedelta
+
+#: The slowest recorded apply of a migration
+MigrationTiming = namedtuple(
+    "MigrationTiming",
+    [
+        "migration_id",
+        "duration_ms",
+        "sql_step_ms",
+        "python_step_ms",
+        "applied_at",
+    ],
+)
+
+#: Migrations applied in a single run (eg one ``yoyo apply``)
+RunTiming = namedtuple(
+    "RunTiming", ["run_id", "started_at", "migrations", "duration_ms"]
+)
+
+
+class Stats(object):
+    """
+    Timings of the migrations applied.
+
+    :ivar migrations: list of :class:`MigrationTiming`, slowest first
+    :ivar runs: list of :class:`RunTiming`, oldest first
+    :ivar duration_ms: total time spent applying migrations
+    :ivar sql_step_ms: total time of SQL steps
+    :ivar python_step_ms: total time of python steps, including any queries
+                          they run themselves
+
+    Step times are totals by the kind of step, not a split between python
+    and database time: see :mod:`yoyo.resources` for that.
+    """
+
+    def __init__(self, migrations, runs, duration_ms, sql_step_ms, python_step_ms):
+        self.migrations = migrations
+        self.runs = runs
+        self.duration_ms = duration_ms
+        self.sql_step_ms = sql_step_ms
+        self.python_step_ms = python_step_ms
+
+    @property
+    def other_ms(self):
+        """
+        Time not spent in steps, eg committing and updating yoyo's tables
+        """
+        return max(0, self.duration_ms - self.sql_step_ms - self.python_step_ms)
+
+
+def get_stats(backend, since=None):
+    """
+    Return :class:`Stats` for the migrations applied to ``backend``, read
+    from the migration log.
+
+    Log entries written before timings were recorded are ignored.
+
+    :param since: only consider migrations applied at or after this datetime
+    """
+    slowest = {}
+    runs = OrderedDict()
+    duration_ms = sql_step_ms = python_step_ms = 0
+    for entry in backend.iter_log(since=since, operation="apply"):
+        if entry["duration_ms"] is None:
+            continue
+        timing = MigrationTiming(
+            entry["migration_id"],
+            entry["duration_ms"],
+            entry["sql_step_ms"] or 0,
+            entry["python_step_ms"] or 0,
+            entry["created_at_utc"],
+        )
+        previous = slowest.get(timing.migration_id)
+        if previous is None or timing.duration_ms > previous.duration_ms:
+            slowest[timing.migration_id] = timing
+
+        duration_ms += timing.duration_ms
+        sql_step_ms += timing.sql_step_ms
+        python_step_ms += timing.python_step_ms
+
+        run_id = entry["run_id"] or entry["id"]
+        run = runs.get(run_id)
+        if run is None:
+            # Entries are logged once each migration has been applied
+            started_at = timing.applied_at - timedelta(
+                milliseconds=timing.duration_ms
+            )
+            runs[run_id] = RunTiming(run_id, started_at, 1, timing.duration_ms)
+        else:
+            runs[run_id] = run._replace(
+                migrations=run.migrations + 1,
+                duration_ms=run.duration_ms + timing.duration_ms,
+            )
+
+    return Stats(
+        migrations=sorted(
+            slowest.values(), key=lambda t: t.duration_ms, reverse=True
+        ),
+        runs=list(runs.values()),
+        duration_ms=duration_ms,
+        sql_step_ms=sql_step_ms,
+        python_step_ms=python_step_ms,
+    )
@@ -167,3 +167,16 @@ def change_param_style(target_style, sql, bind_parameters):
             positional_params.append(bind_parameters[param_name])
         return transformed_sql, tuple(positional_params)
     return transformed_sql, bind_parameters
+
+
+def backoff(initial=0.01, maximum=0.5, factor=2):
+    """
+    Generate an endless series of exponentially increasing delays, each
+    randomized ("jittered") so that concurrent waiters do not retry in
+    lockstep.
+    """
+    rng = random.Random()
+    delay = initial
+    while True:
+        yield rng.uniform(delay / 2.0, delay)
+        delay = min(delay * factor, maximum)